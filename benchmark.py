@@ -0,0 +1,113 @@
+#! /usr/bin/python3
+
+# micro-benchmarks for the building blocks of BISON
+import sys
+import time
+import os
+import importlib
+
+import numpy as np
+
+from src.functions import *
+from src.optimization import *
+from src.matrix_model import *
+
+# ---------------------------------------------------
+# --- let's start
+# ---------------------------------------------------
+
+try:
+
+    filename = sys.argv[1]
+
+    filepath = os.path.join("cfg", filename + '.py')
+
+    if os.path.isfile(filepath):
+
+        instance = importlib.import_module("cfg." + filename)
+
+    else:
+
+        print(f"File not found in the 'cfg' folder.")
+        quit()
+
+except IndexError:
+
+    print(f"Call: python3 benchmark.py <instance name>")
+    quit()
+
+print(f"BISON benchmark for '{filename}'")
+
+map, ocean, ocean_surface, min_depth, max_depth, depth_layer_hight, resolution, occupancy = reading_in_ocean_data(instance)
+
+# ---------------------------------------------------
+# --- line of sight
+# ---------------------------------------------------
+
+# all lines from the surface to the ocean and back, as in compute_visibility
+surface = np.array(list(ocean_surface.keys()))
+targets = np.array(list(ocean.keys()))
+
+start = np.concatenate((np.repeat(surface, len(targets), axis=0), np.tile(targets, (len(surface), 1))))
+end = np.concatenate((np.tile(targets, (len(surface), 1)), np.repeat(surface, len(targets), axis=0)))
+
+print(f"Tracing {len(start)} lines of sight")
+
+start_time = time.time()
+blocked_dict = np.array([check_line(x1, y1, z1, x2, y2, z2, ocean) == 1 for (x1, y1, z1), (x2, y2, z2) in zip(start.tolist(), end.tolist())])
+time_dict = time.time() - start_time
+
+start_time = time.time()
+blocked_grid = np.array([check_line_grid(x1, y1, z1, x2, y2, z2, occupancy) == 1 for (x1, y1, z1), (x2, y2, z2) in zip(start.tolist(), end.tolist())])
+time_grid = time.time() - start_time
+
+start_time = time.time()
+blocked_batch = check_lines(start, end, occupancy)
+time_batch = time.time() - start_time
+
+print(f"check_line      : {time_dict:8.3f} sec, {len(start) / max(time_dict, 1e-9):12.0f} lines/sec")
+print(f"check_line_grid : {time_grid:8.3f} sec, {len(start) / max(time_grid, 1e-9):12.0f} lines/sec, same result: {np.array_equal(blocked_dict, blocked_grid)}")
+print(f"check_lines     : {time_batch:8.3f} sec, {len(start) / max(time_batch, 1e-9):12.0f} lines/sec, same result: {np.array_equal(blocked_dict, blocked_batch)}")
+
+# ---------------------------------------------------
+# --- model building
+# ---------------------------------------------------
+
+visible_tx, visible_rx = compute_visibility(ocean, ocean_surface, occupancy)
+detection_prob = compute_coverage_triples_numpy(instance, ocean, ocean_surface, depth_layer_hight, resolution, visible_tx, visible_rx)
+_, detection_prob_rowsum_s = compute_rowsum_detection_prob(instance, ocean, ocean_surface, detection_prob)
+
+print(f"Building the model for {len(detection_prob_rowsum_s)} detection keys")
+
+start_time = time.time()
+model = create_optimization_model(instance, ocean_surface, ocean, detection_prob_rowsum_s, detection_prob)
+time_model = time.time() - start_time
+
+def coverage_expr(keys):
+    return sum(detection_prob_rowsum_s[k] * model.s[(k[4], k[5], k[6])] - model.y[k] for k in keys)
+
+targets_thetas = list(model.coverage_constraints.keys())
+
+# the old coverage constraints scan all detection keys for every target and angle, so only a sample is timed
+sample = targets_thetas[:10]
+
+start_time = time.time()
+for tar_x, tar_y, tar_z, theta in sample:
+    coverage_expr([k for k in model.detection_keys if k[0] == tar_x and k[1] == tar_y and k[2] == tar_z and k[3] == theta])
+time_scan = (time.time() - start_time) * len(targets_thetas) / max(len(sample), 1)
+
+start_time = time.time()
+keys_by_target = group_detection_keys(detection_prob_rowsum_s)
+for tar_theta in targets_thetas:
+    coverage_expr(keys_by_target.get(tar_theta, []))
+time_grouped = time.time() - start_time
+
+print(f"model           : {time_model:8.3f} sec")
+print(f"coverage (scan) : {time_scan:8.3f} sec, estimated from {len(sample)} of {len(targets_thetas)} constraints")
+print(f"coverage (group): {time_grouped:8.3f} sec")
+
+start_time = time.time()
+matrix_model = MatrixModel(instance, ocean_surface, ocean, detection_prob_rowsum_s, detection_prob)
+time_matrix = time.time() - start_time
+
+print(f"matrix model    : {time_matrix:8.3f} sec, same model: {check_matrix_model(matrix_model, model)}")
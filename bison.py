@@ -12,8 +12,11 @@ from datetime import datetime
 
 from src.outputs import *
 from src.functions import *
+from src.cache import *
 from src.classes import *
 from src.optimization import *
+from src.matrix_model import *
+from src.placement import *
 
 # ---------------------------------------------------
 # --- let's start
@@ -92,7 +95,7 @@ print(f"Called")
 # --- read ocean elevation data file
 # ---------------------------------------------------
 
-map, ocean, ocean_surface, min_depth, max_depth, depth_layer_hight, resolution = reading_in_ocean_data(instance)
+map, ocean, ocean_surface, min_depth, max_depth, depth_layer_hight, resolution, occupancy = reading_in_ocean_data(instance)
 
 # ---------------------------------------------------
 # --- create outputs
@@ -110,33 +113,161 @@ create_map_dat(instance, map, outdir)
 # plot function g
 create_plot_func_g(instance, outdir)
 
+# ---------------------------------------------------
+# --- look up coverage in cache
+# ---------------------------------------------------
+
+# --clear-cache empties the coverage cache, --no-cache neither reads nor writes it
+if "--clear-cache" in sys.argv:
+
+    clear_coverage_cache(instance.CACHE_DIR)
+
+detection_prob = None
+
+if "--no-cache" not in sys.argv:
+
+    print(f"Looking up coverage in cache")
+
+    detection_prob = load_coverage_cache(instance, ocean, ocean_surface)
+
+# the matrix model can be built from the blocks of the coverage while they are computed, if
+# nothing else needs the detection triples before the solve
+streaming = instance.STREAMING == 1 and detection_prob is None
+
+if streaming and not (instance.ENGINE == 1 and instance.BACKEND == 1 and instance.LAZY == 0 and instance.USERCUTS == 0 and instance.GREEDY == 0):
+
+    print(f"STREAMING needs ENGINE = 1, BACKEND = 1, LAZY = 0, USERCUTS = 0 and GREEDY = 0, computing all detection triples first")
+
+    streaming = False
+
+# ---------------------------------------------------
+# --- compute line of sight
+# ---------------------------------------------------
+
+# the incremental mode keeps the line of sight of the area, so it is computed in one process
+incremental = instance.INCREMENTAL == 1 and instance.ENGINE == 1 and "--no-cache" not in sys.argv
+
+# the parallel coverage traces the lines of sight in its workers
+workers = coverage_workers(instance) if instance.ENGINE == 1 and not incremental else 1
+
+visibility = None
+previous = None
+
+if detection_prob is None and incremental:
+
+    print(f"Looking up line of sight in cache")
+
+    visibility = load_visibility_cache(instance, ocean, ocean_surface)
+
+    # detections with smaller RHO_0 or larger RB are kept, only the other pairs are tested again
+    if visibility is not None:
+
+        previous = load_previous_coverage(instance, ocean, ocean_surface)
+
+if detection_prob is None and visibility is not None:
+
+    visible_tx, visible_rx = visibility
+
+elif detection_prob is None and workers == 1:
+
+    print(f"Computing line of sight")
+
+    visible_tx, visible_rx = compute_visibility(ocean, ocean_surface, occupancy)
+
+    if incremental:
+
+        save_visibility_cache(instance, visible_tx, visible_rx)
+
 # ---------------------------------------------------
 # --- compute coverage
 # ---------------------------------------------------
 
-print(f"Computing coverage")
+if detection_prob is None:
+
+    print(f"Computing coverage")
+
+    # the blocks are only computed while the model is built
+    if streaming and workers > 1:
+
+        blocks = coverage_blocks_parallel(instance, ocean, ocean_surface, depth_layer_hight, resolution, occupancy, workers)
+
+    elif streaming:
+
+        blocks = coverage_blocks(instance, ocean, ocean_surface, depth_layer_hight, resolution, visible_tx, visible_rx, previous)
+
+    elif workers > 1:
+
+        detection_prob = compute_coverage_triples_parallel(instance, ocean, ocean_surface, depth_layer_hight, resolution, occupancy, workers)
 
-detection_prob = compute_coverage_triples(instance, ocean, ocean_surface, depth_layer_hight, resolution)
+    elif instance.ENGINE == 1:
+
+        detection_prob = compute_coverage_triples_numpy(instance, ocean, ocean_surface, depth_layer_hight, resolution, visible_tx, visible_rx, previous)
+
+    else:
+
+        detection_prob = compute_coverage_triples(instance, ocean, ocean_surface, depth_layer_hight, resolution, visible_tx, visible_rx)
+
+    if "--no-cache" not in sys.argv and not streaming:
+
+        save_coverage_cache(instance, detection_prob)
 
 # ---------------------------------------------------
 # --- computing the rowsum in detection_prob
 # ---------------------------------------------------
 
-print(f"Computing detection prob")
+# with streaming the row sums are computed block by block while the model is built
+if not streaming:
+
+    print(f"Computing detection prob")
 
-detection_prob_rowsum_r, detection_prob_rowsum_s = compute_rowsum_detection_prob(instance, ocean, ocean_surface, detection_prob)
+    # only the row sums over the receivers are used by the model
+    _, detection_prob_rowsum_s = compute_rowsum_detection_prob(instance, ocean, ocean_surface, detection_prob)
 
 # ---------------------------------------------------
 # --- set up & compute optimization model
 # ---------------------------------------------------
 
+mip_start = None
+
+if instance.GREEDY == 1:
+
+    print(f"Running greedy heuristic")
+
+    mip_start = greedy_heuristic(instance, ocean, ocean_surface, detection_prob)
+
 print(f"Create optimization model")
 
-model = create_optimization_model(instance, ocean_surface, ocean, detection_prob_rowsum_s, detection_prob)
+if instance.BACKEND == 1:
+
+    if streaming:
+
+        model = MatrixModel.from_blocks(instance, ocean_surface, ocean, blocks)
+
+    else:
+
+        # the lazy constraints are only separated in the branch and bound, the root relaxation needs the full model
+        model = MatrixModel(instance, ocean_surface, ocean, detection_prob_rowsum_s, detection_prob, lazy=instance.LAZY == 1 and instance.SOLVE > 0)
+
+    print(f"Solve optimization model")
+
+    solve_matrix_model(model, instance, outdir, mip_start)
+
+    if streaming:
+
+        # the detection triples for the outputs and the cache, after CPLEX has released the model
+        detection_prob = model.detection_tensor(ocean, ocean_surface)
+
+        if "--no-cache" not in sys.argv:
+
+            save_coverage_cache(instance, detection_prob)
+
+else:
+
+    model = create_optimization_model(instance, ocean_surface, ocean, detection_prob_rowsum_s, detection_prob)
 
-print(f"Solve optimization model")
+    print(f"Solve optimization model")
 
-solve_model(model, instance, ocean_surface, outdir, 'cplex')  # or 'cplex', 'gurobi', etc.
+    solve_model(model, instance, ocean_surface, outdir, 'cplex', mip_start)  # or 'cplex', 'gurobi', etc.
 
 # ---------------------------------------------------
 # --- output optimization model results
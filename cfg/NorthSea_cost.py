@@ -3,6 +3,8 @@ INPUT      = "Northsea_20250214_120045.asc"            # file name of ocean floo
 RAM        = 131072                     # RAM allocation in MB
 X          = 16                         # number of pixels in x-direction
 Y          = 16                         # number of pixels in y-direction
+WINDOW     = None                       # (x, y) offset of the area from the bottom left corner of the data file in pixels
+BBOX       = None                       # (min longitude, min latitude, max longitude, max latitude) of the area, overrides X, Y and WINDOW
 GOAL       = 0                          # optimization goal: cover all pixels, minimize cost (0), or maximize coverage (1)
 
 # Equipment parameters
@@ -29,4 +31,19 @@ USERCUTSTRENGTH     = 1.0        # how deep must user cuts be to be separated?
 HEURISTIC           = 50       # 0=no heuristic, >0: with heuristic, number of rounds
 SOLVE               = 2          # 0=only root relaxation, 1=root+cuts, 2=to the end
 TIMELIMIT           = 86400      # time limit in seconds
-TIMELIMIT_HEURISTIC = 1728        # time limit in seconds
\ No newline at end of file
+TIMELIMIT_HEURISTIC = 1728        # time limit in seconds
+
+# Performance parameters
+ENGINE              = 1          # coverage engine: 0=python loops, 1=numpy vectorized
+CACHE_DIR           = "cache/"   # directory of the coverage cache
+CACHE_SIZE          = 10240      # maximum size of the coverage cache in MB
+BACKEND             = 0          # optimization model: 0=pyomo, 1=sparse matrices loaded with the cplex python API
+HEURISTIC_WORKERS   = 1          # number of processes for the rounds of the heuristic, 1=serial
+SEED                = 0          # seed of the random numbers of the heuristic
+GREEDY              = 1          # 0=no greedy heuristic, 1=greedy and local search placement as MIP start
+HEURISTIC_SAMPLING  = 0          # source sets of the heuristic: 0=uniform, 1=weighted by the number of detections of a source
+LAZY                = 0          # 1=coverage constraints are separated in a lazy constraint callback (BACKEND = 1), 0=all constraints in the model
+MAXCUTS             = 100        # maximum number of cuts added per callback call, the most violated first, 0=all
+COVERAGE_WORKERS    = 0          # number of processes for the coverage (ENGINE = 1), 0=$SLURM_CPUS_PER_TASK or 1 outside of SLURM
+INCREMENTAL         = 0          # 1=reuse the cached line of sight of the area and the cached coverage with smaller RHO_0 or larger RB (ENGINE = 1, one process)
+STREAMING           = 0          # 1=build the matrix model from blocks of targets while the coverage is computed (ENGINE = 1, BACKEND = 1, no LAZY, USERCUTS or GREEDY)
\ No newline at end of file
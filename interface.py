@@ -318,6 +318,8 @@ if get_depth:
                             f'RAM        = {16 * 8192}                     # RAM allocation in MB',
                             f'X          = {x_dim}                         # number of pixels in x-direction',
                             f'Y          = {y_dim}                         # number of pixels in y-direction',
+                            f'WINDOW     = None                       # (x, y) offset of the area from the bottom left corner of the data file in pixels',
+                            f'BBOX       = None                       # (min longitude, min latitude, max longitude, max latitude) of the area, overrides X, Y and WINDOW',
                             f'GOAL       = {0 if opt_type == "Cost" else 1}                          # optimization goal: cover all pixels, minimize cost (0), or maximize coverage (1)',
                             '',
                             '# Equipment parameters',
@@ -365,6 +367,25 @@ if get_depth:
                             f'TIMELIMIT_HEURISTIC = {int(time_limit/50)}        # time limit in seconds'
                         ])
                         
+                        # Add performance parameters
+                        config_content.extend([
+                            '',
+                            '# Performance parameters',
+                            'ENGINE              = 1          # coverage engine: 0=python loops, 1=numpy vectorized',
+                            'CACHE_DIR           = "cache/"   # directory of the coverage cache',
+                            'CACHE_SIZE          = 10240      # maximum size of the coverage cache in MB',
+                            'BACKEND             = 0          # optimization model: 0=pyomo, 1=sparse matrices loaded with the cplex python API',
+                            'HEURISTIC_WORKERS   = 1          # number of processes for the rounds of the heuristic, 1=serial',
+                            'SEED                = 0          # seed of the random numbers of the heuristic',
+                            'GREEDY              = 1          # 0=no greedy heuristic, 1=greedy and local search placement as MIP start',
+                            'HEURISTIC_SAMPLING  = 0          # source sets of the heuristic: 0=uniform, 1=weighted by the number of detections of a source',
+                            'LAZY                = 0          # 1=coverage constraints are separated in a lazy constraint callback (BACKEND = 1), 0=all constraints in the model',
+                            'MAXCUTS             = 100        # maximum number of cuts added per callback call, the most violated first, 0=all',
+                            'COVERAGE_WORKERS    = 0          # number of processes for the coverage (ENGINE = 1), 0=$SLURM_CPUS_PER_TASK or 1 outside of SLURM',
+                            'INCREMENTAL         = 0          # 1=reuse the cached line of sight of the area and the cached coverage with smaller RHO_0 or larger RB (ENGINE = 1, one process)',
+                            'STREAMING           = 0          # 1=build the matrix model from blocks of targets while the coverage is computed (ENGINE = 1, BACKEND = 1, no LAZY, USERCUTS or GREEDY)'
+                        ])
+                        
                         # Save configuration file
                         with open(config_file, 'w') as f:
                             f.write('\n'.join(config_content))
@@ -0,0 +1,350 @@
+import hashlib
+import inspect
+import os
+import time
+
+import numpy as np
+
+from src.functions import DetectionTensor, coverage_grows, grid_window, reading_in_ocean_data
+
+# bump this if the physics of the coverage computation or the storage format changes
+COVERAGE_CACHE_VERSION = 4
+
+def geometry_cache_key(instance):
+
+    """
+    Content address of the geometry of an instance.
+
+    Only the inputs which change the ocean and its surface are hashed: the bytes of the ocean
+    floor data file, the size and position of the area and the depth layer logic of
+    reading_in_ocean_data. The line of sight and the distances only depend on these, so runs
+    which sweep the physical parameters over one area share the key.
+
+    Parameters:
+    - instance (module): instance configuration
+
+    Returns:
+    - str: hex digest identifying the geometry
+    """
+
+    key = hashlib.sha256()
+
+    with open(instance.DIR + "/" + instance.INPUT, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            key.update(chunk)
+
+    key.update(repr((COVERAGE_CACHE_VERSION, instance.X, instance.Y, instance.WINDOW, getattr(instance, "BBOX", None))).encode())
+    key.update(inspect.getsource(reading_in_ocean_data).encode())
+    key.update(inspect.getsource(grid_window).encode())
+
+    return key.hexdigest()
+
+def coverage_cache_key(instance, geometry_key=None):
+
+    """
+    Content address of the coverage of an instance.
+
+    Only the inputs which change the detection triples are hashed: the geometry (see
+    geometry_cache_key), the physical parameters, the target strength function and the
+    discretization of the target angle. Cost parameters, heuristic and time limits do not change
+    the key.
+
+    Parameters:
+    - instance (module): instance configuration
+    - geometry_key (str): geometry_cache_key of the instance, if it is already known
+
+    Returns:
+    - str: hex digest identifying the coverage
+    """
+
+    if geometry_key is None:
+        geometry_key = geometry_cache_key(instance)
+
+    key = hashlib.sha256(geometry_key.encode())
+
+    key.update(repr((instance.RHO_0, instance.RB, list(instance.TS), instance.STEPS)).encode())
+
+    return key.hexdigest()
+
+def coverage_cache_path(instance):
+
+    # entries of one area start with its geometry key, so the runs of a sweep can be found
+    geometry_key = geometry_cache_key(instance)
+
+    return os.path.join(instance.CACHE_DIR, geometry_key + "-" + coverage_cache_key(instance, geometry_key) + ".npz")
+
+def read_coverage(path, instance, ocean, ocean_surface):
+
+    # detection triples of a cache entry, None if they do not fit the instance
+    with np.load(path) as data:
+        target = data["target"]
+        theta = data["theta"]
+        source = data["source"]
+        receiver = data["receiver"]
+        value = data["value"] if "value" in data else None
+
+    thetas = list(range(0, 180, instance.STEPS))
+
+    if len(target) and (target.max() >= len(ocean) or theta.max() >= len(thetas) or max(source.max(), receiver.max()) >= len(ocean_surface)):
+
+        print(f"coverage in cache '{path}' does not fit the instance, ignoring it")
+        return None
+
+    return DetectionTensor(ocean, ocean_surface, thetas, target, theta, source, receiver, value)
+
+def load_coverage_cache(instance, ocean, ocean_surface):
+
+    """
+    Load detection triples from the coverage cache.
+
+    Parameters:
+    - instance (module): instance configuration
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+
+    Returns:
+    - DetectionTensor: detection triples on a hit
+    - None: if the coverage of the instance is not in the cache
+    """
+
+    start_time_cache = time.time()
+
+    path = coverage_cache_path(instance)
+
+    if not os.path.isfile(path):
+
+        print(f"coverage not found in cache '{instance.CACHE_DIR}'")
+        return None
+
+    detection_prob = read_coverage(path, instance, ocean, ocean_surface)
+
+    if detection_prob is None:
+        return None
+
+    # mark as recently used for the eviction
+    os.utime(path)
+
+    end_time_cache = time.time()
+
+    print(f"it took {(end_time_cache - start_time_cache):.2f} sec to load {len(detection_prob)} detection triples from cache '{path}'")
+
+    return detection_prob
+
+def save_coverage_cache(instance, detection_prob):
+
+    """
+    Store detection triples in the coverage cache and evict old entries.
+
+    The detection triples are stored as the integer arrays of the detection tensor, the row sums
+    are cheap to recompute and not stored. The physical parameters are stored with them, so
+    load_previous_coverage can find the entries of the same area.
+
+    Parameters:
+    - instance (module): instance configuration
+    - detection_prob (DetectionTensor): detection triples
+    """
+
+    start_time_cache = time.time()
+
+    if not os.path.exists(instance.CACHE_DIR):
+        os.makedirs(instance.CACHE_DIR)
+
+    path = coverage_cache_path(instance)
+
+    # write to a temporary file first, so a crash does not leave a broken entry
+    with open(path + ".tmp", "wb") as file:
+        arrays = {"target": detection_prob.target, "theta": detection_prob.theta, "source": detection_prob.source, "receiver": detection_prob.receiver}
+        arrays["physics"] = np.array([instance.RHO_0, instance.RB, instance.STEPS], dtype=float)
+        arrays["ts"] = np.array(instance.TS, dtype=float).reshape(-1, 2)
+
+        if detection_prob.value is not None:
+            arrays["value"] = detection_prob.value
+
+        np.savez(file, **arrays)
+
+    os.replace(path + ".tmp", path)
+
+    end_time_cache = time.time()
+
+    print(f"it took {(end_time_cache - start_time_cache):.2f} sec to store {len(detection_prob)} detection triples in cache '{path}'")
+
+    evict_coverage_cache(instance.CACHE_DIR, instance.CACHE_SIZE)
+
+def load_previous_coverage(instance, ocean, ocean_surface):
+
+    """
+    Load the detection triples of an earlier run of the same area from the coverage cache.
+
+    Only entries with the same TS and STEPS whose detections are all detections of the instance
+    are used, see coverage_grows. Among them the entry with the closest RHO_0 and RB is taken.
+
+    Parameters:
+    - instance (module): instance configuration
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+
+    Returns:
+    - DetectionTensor: detection triples of the earlier run
+    - None: if there is no such entry in the cache
+    """
+
+    start_time_cache = time.time()
+
+    if not os.path.exists(instance.CACHE_DIR):
+        return None
+
+    geometry_key = geometry_cache_key(instance)
+
+    best = None
+
+    for name in os.listdir(instance.CACHE_DIR):
+
+        if not name.startswith(geometry_key + "-") or not name.endswith(".npz") or name == geometry_key + "-visibility.npz":
+            continue
+
+        path = os.path.join(instance.CACHE_DIR, name)
+
+        with np.load(path) as data:
+
+            if "physics" not in data:
+                continue
+
+            rho_0, rb, steps = data["physics"].tolist()
+            ts = [tuple(point) for point in data["ts"].tolist()]
+
+        if steps != instance.STEPS or ts != [(float(angle), float(strength)) for angle, strength in instance.TS]:
+            continue
+
+        distance = abs(rho_0 - instance.RHO_0) + abs(rb - instance.RB)
+
+        if coverage_grows(instance, rho_0, rb) and (best is None or distance < best[0]):
+            best = (distance, path, rho_0, rb)
+
+    if best is None:
+
+        print(f"no coverage of the same area with smaller RHO_0 or larger RB in cache '{instance.CACHE_DIR}'")
+        return None
+
+    _, path, rho_0, rb = best
+
+    detection_prob = read_coverage(path, instance, ocean, ocean_surface)
+
+    if detection_prob is None:
+        return None
+
+    os.utime(path)
+
+    end_time_cache = time.time()
+
+    print(f"it took {(end_time_cache - start_time_cache):.2f} sec to load {len(detection_prob)} detection triples with RHO_0 = {rho_0:g} and RB = {rb:g} from cache '{path}'")
+
+    return detection_prob
+
+def load_visibility_cache(instance, ocean, ocean_surface):
+
+    """
+    Load the line of sight of the area of an instance from the coverage cache.
+
+    Parameters:
+    - instance (module): instance configuration
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+
+    Returns:
+    - tuple: visible_tx, visible_rx as in compute_visibility
+    - None: if the line of sight of the area is not in the cache
+    """
+
+    start_time_cache = time.time()
+
+    path = os.path.join(instance.CACHE_DIR, geometry_cache_key(instance) + "-visibility.npz")
+
+    if not os.path.isfile(path):
+
+        print(f"line of sight not found in cache '{instance.CACHE_DIR}'")
+        return None
+
+    shape = (len(ocean_surface), len(ocean))
+
+    with np.load(path) as data:
+
+        if data["shape"].tolist() != list(shape):
+
+            print(f"line of sight in cache '{path}' does not fit the instance, ignoring it")
+            return None
+
+        # stored as bits, one row per surface pixel
+        visible_tx = np.unpackbits(data["visible_tx"], axis=1, count=shape[1]).astype(bool)
+        visible_rx = np.unpackbits(data["visible_rx"], axis=1, count=shape[1]).astype(bool)
+
+    os.utime(path)
+
+    end_time_cache = time.time()
+
+    print(f"it took {(end_time_cache - start_time_cache):.2f} sec to load {2 * visible_tx.size} lines of sight from cache '{path}'")
+
+    return visible_tx, visible_rx
+
+def save_visibility_cache(instance, visible_tx, visible_rx):
+
+    """
+    Store the line of sight of the area of an instance in the coverage cache.
+
+    Parameters:
+    - instance (module): instance configuration
+    - visible_tx (np.ndarray): line of sight from surface pixels to ocean pixels, see compute_visibility
+    - visible_rx (np.ndarray): line of sight from ocean pixels to surface pixels, see compute_visibility
+    """
+
+    if not os.path.exists(instance.CACHE_DIR):
+        os.makedirs(instance.CACHE_DIR)
+
+    path = os.path.join(instance.CACHE_DIR, geometry_cache_key(instance) + "-visibility.npz")
+
+    with open(path + ".tmp", "wb") as file:
+        np.savez(file, shape=np.array(visible_tx.shape), visible_tx=np.packbits(visible_tx, axis=1), visible_rx=np.packbits(visible_rx, axis=1))
+
+    os.replace(path + ".tmp", path)
+
+    print(f"stored {2 * visible_tx.size} lines of sight in cache '{path}'")
+
+    evict_coverage_cache(instance.CACHE_DIR, instance.CACHE_SIZE)
+
+def evict_coverage_cache(cache_dir, max_size):
+
+    """
+    Remove the least recently used entries until the cache is not larger than max_size MB.
+
+    Parameters:
+    - cache_dir (str): directory of the coverage cache
+    - max_size (int): maximum size of the cache in MB
+    """
+
+    if not os.path.exists(cache_dir):
+        return
+
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".npz")]
+    entries = sorted(entries, key=os.path.getmtime)
+
+    size = sum(os.path.getsize(path) for path in entries)
+
+    while entries and size > max_size * 1024 * 1024:
+
+        path = entries.pop(0)
+        size -= os.path.getsize(path)
+        os.remove(path)
+
+        print(f"evicted '{path}' from coverage cache")
+
+def clear_coverage_cache(cache_dir):
+
+    """
+    Remove all entries of the coverage cache.
+
+    Parameters:
+    - cache_dir (str): directory of the coverage cache
+    """
+
+    evict_coverage_cache(cache_dir, 0)
+
+    print(f"cleared coverage cache '{cache_dir}'")
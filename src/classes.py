@@ -1,8 +1,11 @@
 import sys
+import time
 
 from math import *
 from datetime import datetime
 
+import numpy as np
+
 import cplex
 from cplex.callbacks import LazyConstraintCallback
 from cplex.callbacks import UserCutCallback
@@ -46,261 +49,172 @@ class color:
 	END 		= '\033[0m'
 	
 # ---------------------------------------------------
-# --- Lazy Cut Callback (for Rodrigues et al., 2014)
+# --- cuts of Rodrigues et al., 2014
 # ---------------------------------------------------
 
-class LazyCallback(LazyConstraintCallback):
+class CoverageSeparator:
 
-	def __call__(self, instance, ocean, detection_prob, s, r, c, theta):
-		self.number_of_calls += 1
+	"""
+	Separate the coverage of every (target, theta) for the solution values of the matrix model.
 
-		# get incumbent solution values
+	All sources and receivers are sorted by decreasing value. Every detecting (source, receiver)
+	pair adds its value to the coefficient of the later of both, and the coefficients are capped
+	at 1. As the number of detecting pairs grows supermodular in the deployed sources and receivers,
+	the sum of these coefficients over the deployed ones is at least 1 for every covered (target,
+	theta), which gives a valid cut.
 
-		value_of_s = {}
-		value_of_r = {}
+	The detections are grouped by (target, theta, source) and (target, theta, receiver) once, so
+	the coefficients of all cuts are computed with a few array operations per call.
 
-		for gx,gy in ocean:
-			value_of_s[gx,gy] = self.get_values(s[gx,gy])
-			value_of_r[gx,gy] = self.get_values(r[gx,gy])
+	Parameters:
+	- model (MatrixModel): the model
+	"""
 
-		if instance.GOAL == 1: # goal: deploy equipment, maximize coverage
-			value_of_c = {}
-			for tx,ty in ocean:
-				value_of_c[tx,ty] = self.get_values(c[tx,ty])
+	def __init__(self, model):
 
-		# sorting
-
-		sort_me = []
-
-		for gx,gy in ocean:
-			sort_me.append((gx,gy,'s',value_of_s[gx,gy]))
-			sort_me.append((gx,gy,'r',value_of_r[gx,gy]))
-
-		sort_me = sorted(sort_me, key=lambda sort_me: sort_me[3], reverse=True)
-		n = len(sort_me)
-
-		# compute permutation
-
-		pi = [(0,0,0,0)]
-
-		for i in range(1,n+1):
-			pi.append((sort_me[i-1][0],sort_me[i-1][1],sort_me[i-1][2]))
-
-		for tx,ty in ocean:
-			# compute cut strength
-
-			lhs = 0
-
-			for i in range(2,n+1):
-				var_i = pi[i][2]
-				pi_i_x = pi[i][0]
-				pi_i_y = pi[i][1]
-
-				for j in range(1,i):
-					var_j = pi[j][2]
-					pi_j_x = pi[j][0]
-					pi_j_y = pi[j][1]
-
-					if var_i == 's' and var_j == 'r':
-						if (tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y) in detection_prob:
-							lhs = lhs + detection_prob[tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y] * value_of_s[pi_i_x,pi_i_y]
-
-					if var_i == 'r' and var_j == 's':
-						if (tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y) in detection_prob:
-							lhs = lhs + detection_prob[tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y] * value_of_r[pi_i_x,pi_i_y]
-
-			if instance.CC == 0: # probabilistic model
-				if instance.GOAL == 0: # goal: cover all pixels
-					if lhs <= log(1-instance.dp): # no cut found
-						continue
-				else: # goal: deploy equipment
-					if lhs <= value_of_c[tx,ty] * log(1-instance.dp): # no cut found
-						continue
-			else: # cookie-cutter model
-				if instance.GOAL == 0: # goal: cover all pixels
-					if lhs >= 1.0: # no cut found
-						continue
-				else: # goal: deploy equipment
-					if lhs >= value_of_c[tx,ty]: # no cut found
-						continue
-
-			# generate cut
-
-			thevars = []
-			thecoefs = []
-
-			if instance.GOAL == 1: # goal: deploy equipment, maximize coverage
-				thevars.append(c[tx,ty])
-				if instance.CC == 0: # probabilistic model
-					thecoefs.append(-log(1-instance.dp))
-				else: # cookie-cutter model
-					thecoefs.append(-1.0)
-
-			for i in range(2,n+1):
-				coef = 0
-				var_i = pi[i][2]
-				pi_i_x = pi[i][0]
-				pi_i_y = pi[i][1]
-
-				for j in range(1,i):
-					var_j = pi[j][2]
-					pi_j_x = pi[j][0]
-					pi_j_y = pi[j][1]
-
-					if var_i == 's' and var_j == 'r':
-						if (tx,ty,theta,pi_i_x,pi_i_y,pi_j_x,pi_j_y) in detection_prob:
-							coef = coef + detection_prob[tx,ty,theta,pi_i_x,pi_i_y,pi_j_x,pi_j_y]
-
-					if var_i == 'r' and var_j == 's':
-						if (tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y) in detection_prob:
-							coef = coef + detection_prob[tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y]
-
-				if var_i == 's':
-					thevars.append(s[pi_i_x,pi_i_y])
-				if var_i == 'r':
-					thevars.append(r[pi_i_x,pi_i_y])
-
-				thecoefs.append(coef);
-
-			if instance.CC == 0: # probabilistic model
-				if instance.GOAL == 0: # goal: cover all pixels
-					self.add(constraint = cplex.SparsePair(thevars,thecoefs), sense = "L", rhs = log(1-instance.dp))
-				else: # goal: deploy equipment
-					self.add(constraint = cplex.SparsePair(thevars,thecoefs), sense = "L", rhs = 0.0)
-			else: # cookie-cutter model
-				if instance.GOAL == 0: # goal: cover all pixels
-					self.add(constraint = cplex.SparsePair(thevars,thecoefs), sense = "G", rhs = 1.0)
-				else: # goal: deploy equipment
-					self.add(constraint = cplex.SparsePair(thevars,thecoefs), sense = "G", rhs = 0.0)
+		detection_prob = model.detection_prob
 
-			self.number_of_cuts_added += 1
+		self.model = model
+
+		S = len(model.surface)
+		K = len(model.thetas)
+		TK = len(model.targets) * K
+
+		self.S = S
+		self.K = K
+		self.TK = TK
+
+		self.source = detection_prob.source.astype(np.int64)
+		self.receiver = detection_prob.receiver.astype(np.int64)
+		self.weight = np.ones(len(detection_prob)) if detection_prob.value is None else detection_prob.value
+
+		tk = detection_prob.target.astype(np.int64) * K + detection_prob.theta
+
+		# the detection tensor is ordered by (target, theta, source), for the receivers it is sorted once
+		self.order_r = np.lexsort((self.receiver, tk))
+
+		self.groups_s = self.groups(tk * S + self.source)
+		self.groups_r = self.groups((tk * S + self.receiver)[self.order_r])
+
+		# (target, theta) which a pair detects, the others are constraints of the model
+		self.detectable = np.bincount(tk, minlength=TK) > 0
+
+	def groups(self, keys):
+
+		# first entry, (target, theta), location and first group of every (target, theta) of sorted keys
+		start = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else np.zeros(0, dtype=np.int64)
+		tk = keys[start] // self.S
+		location = keys[start] % self.S
+		pointer = np.concatenate(([0], np.cumsum(np.bincount(tk, minlength=self.TK))))
+
+		return start, tk, location, pointer
+
+	def coefficients(self, groups, weight):
+
+		start, tk, location, pointer = groups
+
+		if len(start) == 0:
+			return np.zeros(0)
+
+		return np.minimum(np.add.reduceat(weight, start), 1.0)
+
+	def separate(self, x, tolerance, max_cuts=0):
+
+		"""
+		Parameters:
+		- x (np.ndarray): value of every column
+		- tolerance (float): how deep a cut must be to be separated
+		- max_cuts (int): maximum number of cuts, the most violated first, 0 for all
+
+		Returns:
+		- list: (columns, coefficients, rhs) of the cuts, to be added with sense "G"
+		"""
+
+		model = self.model
+		S = self.S
+
+		value_of_s = x[model.s_col:model.s_col + S]
+		value_of_r = x[model.r_col:model.r_col + S]
+
+		# position of every source and receiver in the permutation
+		order = np.argsort(-np.concatenate((value_of_s, value_of_r)), kind='stable')
+		position = np.empty(2 * S, dtype=np.int64)
+		position[order] = np.arange(2 * S)
+
+		later_s = position[self.source] > position[S + self.receiver]
+
+		coef_s = self.coefficients(self.groups_s, np.where(later_s, self.weight, 0.0))
+		coef_r = self.coefficients(self.groups_r, np.where(later_s, 0.0, self.weight)[self.order_r])
+
+		_, tk_s, location_s, pointer_s = self.groups_s
+		_, tk_r, location_r, pointer_r = self.groups_r
+
+		lhs = np.bincount(tk_s, weights=coef_s * value_of_s[location_s], minlength=self.TK)
+		lhs += np.bincount(tk_r, weights=coef_r * value_of_r[location_r], minlength=self.TK)
+
+		if model.goal == 0: # goal: cover all pixels
+			rhs = np.ones(self.TK)
+		else: # goal: deploy equipment, maximize coverage
+			rhs = x[model.c_col + np.arange(self.TK) // self.K]
+
+		violation = rhs - lhs
+
+		violated = np.flatnonzero((violation > tolerance) & self.detectable)
+
+		if max_cuts > 0 and len(violated) > max_cuts:
+			violated = violated[np.argsort(-violation[violated], kind='stable')[:max_cuts]]
+
+		cuts = []
+
+		for key in violated.tolist():
+
+			first_s, last_s = pointer_s[key], pointer_s[key + 1]
+			first_r, last_r = pointer_r[key], pointer_r[key + 1]
+
+			nonzero_s = coef_s[first_s:last_s] > 0
+			nonzero_r = coef_r[first_r:last_r] > 0
+
+			columns = (model.s_col + location_s[first_s:last_s][nonzero_s]).tolist() + (model.r_col + location_r[first_r:last_r][nonzero_r]).tolist()
+			coefficients = coef_s[first_s:last_s][nonzero_s].tolist() + coef_r[first_r:last_r][nonzero_r].tolist()
+
+			if model.goal == 0:
+				cuts.append((columns, coefficients, 1.0))
+			else:
+				cuts.append((columns + [model.c_col + key // self.K], coefficients + [-1.0], 0.0))
+
+		return cuts
 
 # ---------------------------------------------------
-# --- User Cut Callback (for Rodrigues et al., 2014)
+# --- Lazy Cut Callback (for Rodrigues et al., 2014)
 # ---------------------------------------------------
 
-class UsercutCallback(UserCutCallback):
+# separator and max_cuts are set after register_callback
+class LazyCallback(LazyConstraintCallback):
 
-	def __call__(self, instance, ocean, detection_prob, s, r, c, theta):
+	def __call__(self):
+		start_time = time.time()
 		self.number_of_calls += 1
 
-		# get incumbent solution values
+		# integer solution, the (target, theta) which are not covered are cut off
+		for columns, coefficients, rhs in self.separator.separate(np.array(self.get_values()), 1e-6, self.max_cuts):
+			self.add(constraint = cplex.SparsePair(columns, coefficients), sense = "G", rhs = rhs)
+			self.number_of_cuts_added += 1
 
-		value_of_s = {}
-		value_of_r = {}
+		self.time += time.time() - start_time
 
-		for gx,gy in ocean:
-			value_of_s[gx,gy] = self.get_values(s[gx,gy])
-			value_of_r[gx,gy] = self.get_values(r[gx,gy])
+# ---------------------------------------------------
+# --- User Cut Callback (for Rodrigues et al., 2014)
+# ---------------------------------------------------
 
-		if instance.GOAL == 1: # goal: deploy equipment, maximize coverage
-			value_of_c = {}
-			for tx,ty in ocean:
-				value_of_c[tx,ty] = self.get_values(c[tx,ty])
+# separator, strength and max_cuts are set after register_callback
+class UsercutCallback(UserCutCallback):
 
-		# sorting
-
-		sort_me = []
-
-		for gx,gy in ocean:
-			sort_me.append((gx,gy,'s',value_of_s[gx,gy]))
-			sort_me.append((gx,gy,'r',value_of_r[gx,gy]))
-
-		sort_me = sorted(sort_me, key=lambda sort_me: sort_me[3], reverse=True)
-		n = len(sort_me)
-
-		# compute permutation
-
-		pi = [(0,0,0,0)]
-
-		for i in range(1,n+1):
-			pi.append((sort_me[i-1][0],sort_me[i-1][1],sort_me[i-1][2]))
-
-		for tx,ty in ocean:
-			# compute cut strength
-
-			lhs = 0
-
-			for i in range(2,n+1):
-				var_i = pi[i][2]
-				pi_i_x = pi[i][0]
-				pi_i_y = pi[i][1]
-
-				for j in range(1,i):
-					var_j = pi[j][2]
-					pi_j_x = pi[j][0]
-					pi_j_y = pi[j][1]
-
-					if var_i == 's' and var_j == 'r':
-						if (tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y) in detection_prob:
-							lhs = lhs + detection_prob[tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y] * value_of_s[pi_i_x,pi_i_y]
-
-					if var_i == 'r' and var_j == 's':
-						if (tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y) in detection_prob:
-							lhs = lhs + detection_prob[tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y] * value_of_r[pi_i_x,pi_i_y]
-
-			if instance.CC == 0: # probabilistic model
-				if instance.GOAL == 0: # goal: cover all pixels
-					if lhs <= log(1-instance.dp) + instance.USERCUTSTRENGTH: # no cut found
-						continue
-				else: # goal: deploy equipment
-					if lhs <= value_of_c[tx,ty] * log(1-instance.dp) + instance.USERCUTSTRENGTH: # no cut found
-						continue
-			else: # cookie-cutter model
-				if instance.GOAL == 0: # goal: cover all pixels
-					if lhs >= 1.0 - instance.USERCUTSTRENGTH: # no cut found
-						continue
-				else: # goal: deploy equipment
-					if lhs >= value_of_c[tx,ty] - instance.USERCUTSTRENGTH: # no cut found
-						continue
-
-			# generate cut
-
-			thevars = []
-			thecoefs = []
-
-			if instance.GOAL == 1: # goal: deploy equipment, maximize coverage
-				thevars.append(c[tx,ty])
-				if instance.CC == 0: # probabilistic model
-					thecoefs.append(-log(1-instance.dp))
-				else: # cookie-cutter model
-					thecoefs.append(-1.0)
-
-			for i in range(2,n+1):
-				coef = 0
-				var_i = pi[i][2]
-				pi_i_x = pi[i][0]
-				pi_i_y = pi[i][1]
-
-				for j in range(1,i):
-					var_j = pi[j][2]
-					pi_j_x = pi[j][0]
-					pi_j_y = pi[j][1]
-
-					if var_i == 's' and var_j == 'r':
-						if (tx,ty,theta,pi_i_x,pi_i_y,pi_j_x,pi_j_y) in detection_prob:
-							coef = coef + detection_prob[tx,ty,theta,pi_i_x,pi_i_y,pi_j_x,pi_j_y]
-
-					if var_i == 'r' and var_j == 's':
-						if (tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y) in detection_prob:
-							coef = coef + detection_prob[tx,ty,theta,pi_j_x,pi_j_y,pi_i_x,pi_i_y]
-
-				if var_i == 's':
-					thevars.append(s[pi_i_x,pi_i_y])
-				if var_i == 'r':
-					thevars.append(r[pi_i_x,pi_i_y])
-
-				thecoefs.append(coef);
-
-			if instance.CC == 0: # probabilistic model
-				if instance.GOAL == 0: # goal: cover all pixels
-					self.add(cut = cplex.SparsePair(thevars,thecoefs), sense = "L", rhs = log(1-instance.dp))
-				else: # goal: deploy equipment
-					self.add(cut = cplex.SparsePair(thevars,thecoefs), sense = "L", rhs = 0.0)
-			else: # cookie-cutter model
-				if instance.GOAL == 0: # goal: cover all pixels
-					self.add(cut = cplex.SparsePair(thevars,thecoefs), sense = "G", rhs = 1.0)
-				else: # goal: deploy equipment
-					self.add(cut = cplex.SparsePair(thevars,thecoefs), sense = "G", rhs = 0.0)
+	def __call__(self):
+		start_time = time.time()
+		self.number_of_calls += 1
 
+		for columns, coefficients, rhs in self.separator.separate(np.array(self.get_values()), self.strength, self.max_cuts):
+			self.add(cut = cplex.SparsePair(columns, coefficients), sense = "G", rhs = rhs)
 			self.number_of_cuts_added += 1
+
+		self.time += time.time() - start_time
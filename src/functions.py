@@ -1,6 +1,15 @@
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
 import numpy as np
-import re
+import os
 import time
+import types
+
+from multiprocessing import shared_memory
+
+from bisect import bisect_left
 
 from math import *
 
@@ -11,53 +20,114 @@ def d(x1, y1, z1, x2, y2, z2, depth_layer_hight, resolution) -> float:
     
     return distance
 
-# target strength piecewise linear function g(cos(theta))
-def g_cos(theta, instance) -> list[float]:
+# target strength piecewise linear function g(cos(theta)) as lookup table
+class TargetStrength:
 
-    theta = np.asarray(theta)
-    scalar_input = False
-    if theta.ndim == 0:
-        theta = theta[None]
-        scalar_input = True
-
-    ret = []
-
-    for x in theta:
-        for i in range(len(instance.TS)-1):
-            w_i = cos(instance.TS[i][0]/180.0*pi)
-            w_ip1 = cos(instance.TS[i+1][0]/180.0*pi)
-            # change yards to meters
-            s_i = instance.TS[i][1] * 0.9144
-            s_ip1 = instance.TS[i+1][1] * 0.9144
-            alpha = cos(x)
-
-            if w_i >= alpha and alpha >= w_ip1:
-                ret.append( s_i + ( (s_ip1 - s_i) * (alpha - w_i) ) / ( w_ip1 - w_i ) )
-                break
-            elif -w_i <= alpha and alpha <= -w_ip1:
-                ret.append( s_i + ( (s_ip1 - s_i) * (alpha + w_i) ) / ( w_i - w_ip1 ) )
-                break
+    """
+    Target strength piecewise linear function, built once from instance.TS.
 
-    if scalar_input:
-        return np.squeeze(ret)
-    
-    return ret
+    The breakpoints cos(TS angle) are stored as an array together with the rise and run of every
+    segment, so g can be evaluated for a scalar or a whole array of alpha = cos(theta) with a
+    binary search instead of scanning all segments. As in the original scan, the first segment
+    that contains alpha or its mirror image -alpha is used, and 0 is returned if there is none.
+    The angles in instance.TS have to be ascending and between 0 and 180 degrees.
 
-def g(alpha, instance) -> float:
+    Parameters:
+    - TS (list): list of (angle in degree, target strength in yards)
+    """
+
+    def __init__(self, TS):
 
-    for i in range(len(instance.TS)-1):
-        w_i = cos(instance.TS[i][0]/180.0*pi)
-        w_ip1 = cos(instance.TS[i+1][0]/180.0*pi)
+        # breakpoints, descending from cos(0) = 1 to cos(pi) = -1
+        self.w = np.array([cos(angle/180.0*pi) for angle, strength in TS], dtype=float)
         # change yards to meters
-        s_i = instance.TS[i][1] * 0.9144
-        s_ip1 = instance.TS[i+1][1] * 0.9144
+        self.s = np.array([strength * 0.9144 for angle, strength in TS], dtype=float)
+
+        # rise and run of the segments
+        self.ds = self.s[1:] - self.s[:-1]
+        self.dw = self.w[1:] - self.w[:-1]
+        self.dw_mirror = self.w[:-1] - self.w[1:]
+
+        # ascending breakpoints for the binary search
+        self.neg_w = -self.w
+
+        self.segments = len(TS) - 1
+
+        # plain lists for the evaluation of single values
+        self.w_list = self.w.tolist()
+        self.s_list = self.s.tolist()
+        self.ds_list = self.ds.tolist()
+        self.dw_list = self.dw.tolist()
+        self.dw_mirror_list = self.dw_mirror.tolist()
+        self.neg_w_list = self.neg_w.tolist()
+
+    def segment(self, alpha):
+
+        # first segment with w_i >= alpha >= w_ip1, -1 if there is none
+        if self.segments < 1:
+            return np.full(np.shape(alpha), -1)
+
+        i = np.clip(np.searchsorted(self.neg_w, -alpha, side='left') - 1, 0, self.segments - 1)
+
+        return np.where((self.w[i] >= alpha) & (alpha >= self.w[i + 1]), i, -1)
+
+    def segment_value(self, alpha):
+
+        # same as segment for a single value, without the overhead of NumPy
+        if self.segments < 1:
+            return -1
+
+        i = min(max(bisect_left(self.neg_w_list, -alpha) - 1, 0), self.segments - 1)
+
+        if self.w_list[i] >= alpha and alpha >= self.w_list[i + 1]:
+            return i
+
+        return -1
+
+    def value(self, alpha):
+
+        i = self.segment_value(alpha)
+        i_mirror = self.segment_value(-alpha)
+
+        if i >= 0 and (i_mirror < 0 or i <= i_mirror):
+            return self.s_list[i] + ( self.ds_list[i] * (alpha - self.w_list[i]) ) / self.dw_list[i]
+        elif i_mirror >= 0:
+            return self.s_list[i_mirror] + ( self.ds_list[i_mirror] * (alpha + self.w_list[i_mirror]) ) / self.dw_mirror_list[i_mirror]
+
+        return 0
+
+    def __call__(self, alpha):
+
+        if np.ndim(alpha) == 0:
+            return self.value(float(alpha))
+
+        alpha = np.asarray(alpha, dtype=float)
 
-        if w_i >= alpha and alpha >= w_ip1:
-            return ( s_i + ( (s_ip1 - s_i) * (alpha - w_i) ) / ( w_ip1 - w_i ) )
-        elif -w_i <= alpha and alpha <= -w_ip1:
-            return ( s_i + ( (s_ip1 - s_i) * (alpha + w_i) ) / ( w_i - w_ip1 ) )
+        ret = np.zeros(alpha.shape)
 
-    return 0
+        # segment hit by alpha itself and by its mirror image, the lower one wins
+        i = self.segment(alpha)
+        i_mirror = self.segment(-alpha)
+
+        direct = (i >= 0) & ((i_mirror < 0) | (i <= i_mirror))
+        mirror = (i_mirror >= 0) & ~direct
+
+        k = i[direct]
+        ret[direct] = self.s[k] + ( self.ds[k] * (alpha[direct] - self.w[k]) ) / self.dw[k]
+
+        k = i_mirror[mirror]
+        ret[mirror] = self.s[k] + ( self.ds[k] * (alpha[mirror] + self.w[k]) ) / self.dw_mirror[k]
+
+        return ret
+
+# target strength piecewise linear function g(cos(theta))
+def g_cos(theta, instance) -> list[float]:
+
+    return TargetStrength(instance.TS)(np.cos(theta))
+
+def g(alpha, instance) -> float:
+
+    return TargetStrength(instance.TS)(alpha)
 
 def check_line(x1, y1, z1, x2, y2, z2, ocean):
 
@@ -159,221 +229,1407 @@ def check_line(x1, y1, z1, x2, y2, z2, ocean):
 
     return None     
 
+def check_line_grid(x1, y1, z1, x2, y2, z2, occupancy):
+
+    """
+    Check if a line intersects with any obstacle in the map, using the dense occupancy grid.
+
+    Same 3D Bresenham line as check_line, but the voxels are visited by their flat index in
+    the occupancy grid and the walk stops at the first blocked voxel, no list of points is built.
+    Both end points have to be inside the grid.
+
+    Parameters:
+    - x1 (int): x-coordinate of the starting point of the line.
+    - y1 (int): y-coordinate of the starting point of the line.
+    - z1 (int): z-coordinate of the starting point of the line.
+    - x2 (int): x-coordinate of the ending point of the line.
+    - y2 (int): y-coordinate of the ending point of the line.
+    - z2 (int): z-coordinate of the ending point of the line.
+    - occupancy (np.ndarray): boolean array of shape (X, Y, layers), True for ocean voxels
+
+    Returns:
+    - int: If the line intersects with an obstacle, returns 1.
+    - None: If the line does not intersect with any obstacle.
+    """
+
+    grid = occupancy.ravel()
+    stride_y = occupancy.shape[2]
+    stride_x = occupancy.shape[1] * stride_y
+
+    index = x1 * stride_x + y1 * stride_y + z1
+
+    if not grid[index]:
+
+        return 1
+
+    dx = abs(x2 - x1)
+    dy = abs(y2 - y1)
+    dz = abs(z2 - z1)
+
+    if (x2 > x1):
+        xs = stride_x
+    else:
+        xs = -stride_x
+    if (y2 > y1):
+        ys = stride_y
+    else:
+        ys = -stride_y
+    if (z2 > z1):
+        zs = 1
+    else:
+        zs = -1
+
+    # Driving axis is X-axis"
+    if (dx >= dy and dx >= dz):
+        p1 = 2 * dy - dx
+        p2 = 2 * dz - dx
+        for _ in range(dx):
+            index += xs
+            if (p1 >= 0):
+                index += ys
+                p1 -= 2 * dx
+            if (p2 >= 0):
+                index += zs
+                p2 -= 2 * dx
+            p1 += 2 * dy
+            p2 += 2 * dz
+            if not grid[index]:
+                return 1
+
+    # Driving axis is Y-axis"
+    elif (dy >= dx and dy >= dz):
+        p1 = 2 * dx - dy
+        p2 = 2 * dz - dy
+        for _ in range(dy):
+            index += ys
+            if (p1 >= 0):
+                index += xs
+                p1 -= 2 * dy
+            if (p2 >= 0):
+                index += zs
+                p2 -= 2 * dy
+            p1 += 2 * dx
+            p2 += 2 * dz
+            if not grid[index]:
+                return 1
+
+    # Driving axis is Z-axis"
+    else:
+        p1 = 2 * dy - dz
+        p2 = 2 * dx - dz
+        for _ in range(dz):
+            index += zs
+            if (p1 >= 0):
+                index += ys
+                p1 -= 2 * dz
+            if (p2 >= 0):
+                index += xs
+                p2 -= 2 * dz
+            p1 += 2 * dy
+            p2 += 2 * dx
+            if not grid[index]:
+                return 1
+
+    return None
+
+def check_lines(start, end, occupancy, block_size=16384):
+
+    """
+    Check many lines at once for obstacles in the map.
+
+    All lines are advanced in lockstep with the same 3D Bresenham steps as check_line, using
+    NumPy indexing into the occupancy grid. In every step each axis moves if its error term is
+    non-negative, for the driving axis this is always the case. Lines leave the active set as
+    soon as they are blocked or have reached their end point. The lines are processed in blocks
+    so the working arrays stay small.
+
+    Parameters:
+    - start (np.ndarray): integer array of shape (N, 3) with the starting points of the lines
+    - end (np.ndarray): integer array of shape (N, 3) with the ending points of the lines
+    - occupancy (np.ndarray): boolean array of shape (X, Y, layers), True for ocean voxels
+    - block_size (int): number of lines walked together
+
+    Returns:
+    - np.ndarray: boolean array of shape (N,), True if the line intersects with an obstacle
+    """
+
+    grid = occupancy.ravel()
+    stride_y = occupancy.shape[2]
+    stride_x = occupancy.shape[1] * stride_y
+
+    start = np.asarray(start, dtype=np.int64).reshape(-1, 3)
+    end = np.asarray(end, dtype=np.int64).reshape(-1, 3)
+
+    blocked = np.zeros(len(start), dtype=bool)
+
+    for first in range(0, len(start), block_size):
+
+        x1, y1, z1 = start[first:first + block_size].T
+        x2, y2, z2 = end[first:first + block_size].T
+
+        dx = np.abs(x2 - x1)
+        dy = np.abs(y2 - y1)
+        dz = np.abs(z2 - z1)
+        length = np.maximum(np.maximum(dx, dy), dz)
+
+        xs = np.where(x2 > x1, stride_x, -stride_x)
+        ys = np.where(y2 > y1, stride_y, -stride_y)
+        zs = np.where(z2 > z1, 1, -1)
+
+        index = x1 * stride_x + y1 * stride_y + z1
+
+        block_blocked = ~grid[index]
+
+        # lines which still have to be walked
+        active = np.nonzero(~block_blocked & (length > 0))[0]
+
+        dx, dy, dz, xs, ys, zs, index, length = (a[active] for a in (dx, dy, dz, xs, ys, zs, index, length))
+
+        px = 2 * dx - length
+        py = 2 * dy - length
+        pz = 2 * dz - length
+
+        n = 0
+
+        while len(active) > 0:
+
+            n += 1
+
+            move_x = px >= 0
+            move_y = py >= 0
+            move_z = pz >= 0
+
+            index += xs * move_x + ys * move_y + zs * move_z
+
+            px += 2 * dx - 2 * length * move_x
+            py += 2 * dy - 2 * length * move_y
+            pz += 2 * dz - 2 * length * move_z
+
+            hit = ~grid[index]
+            block_blocked[active[hit]] = True
+
+            keep = ~hit & (length > n)
+
+            if not keep.all():
+                active, dx, dy, dz, xs, ys, zs, index, length, px, py, pz = (a[keep] for a in (active, dx, dy, dz, xs, ys, zs, index, length, px, py, pz))
+
+        blocked[first:first + block_size] = block_blocked
+
+    return blocked
+
+def read_ascii_grid_header(path):
+
+    """
+    Read the header of an ESRI ASCII grid file.
+
+    Parameters:
+    - path (str): path of the .asc file
+
+    Returns:
+    - dictonary: header values keyed by the lower case names (ncols, nrows, xllcorner, yllcorner, cellsize, nodata_value)
+    - int: number of header lines
+    """
+
+    header = {}
+
+    with open(path, "r") as file:
+        for line in file:
+
+            # the header ends with the first line of numbers
+            if not line[:1].isalpha():
+                break
+
+            name, value = line.split()[:2]
+            header[name.lower()] = float(value)
+
+    for name in ("ncols", "nrows"):
+        header[name] = int(header[name])
+
+    return header, len(header)
+
+def read_ascii_grid(path, rows=None, columns=None):
+
+    """
+    Read the elevation values of an ESRI ASCII grid file, or only a window of it.
+
+    The text is parsed only once: the grid is streamed block by block into a binary .npy sidecar
+    next to the .asc file, so not the whole file has to fit into RAM, and all runs memory-map
+    the sidecar and only touch the rows of the window. The sidecar is rebuilt if the .asc file is
+    newer. If the sidecar cannot be written, only the rows of the window are parsed from the
+    text. Cells with the nodata_value are NaN.
+
+    Parameters:
+    - path (str): path of the .asc file
+    - rows (tuple): (first, last + 1) row of the window, the first row is the northern one, None for all rows
+    - columns (tuple): (first, last + 1) column of the window, None for all columns
+
+    Returns:
+    - dictonary: header of the file, see read_ascii_grid_header
+    - np.ndarray: elevation values of the window
+    """
+
+    header, header_lines = read_ascii_grid_header(path)
+    shape = (header["nrows"], header["ncols"])
+
+    rows = slice(*rows) if rows is not None else slice(None)
+    columns = slice(*columns) if columns is not None else slice(None)
+
+    sidecar = os.path.splitext(path)[0] + ".npy"
+
+    if os.path.isfile(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path):
+
+        grid = np.load(sidecar, mmap_mode="r")
+
+        if grid.shape == shape:
+            return header, grid[rows, columns]
+
+    start_time = time.time()
+
+    try:
+        grid = np.lib.format.open_memmap(sidecar + ".tmp", mode="w+", dtype=float, shape=shape)
+
+    except OSError:
+
+        print(f"could not write '{sidecar}', parsing only the window")
+
+        # parse only the rows of the window
+        first, last, _ = rows.indices(shape[0])
+        grid = parse_ascii_grid_rows(path, header, header_lines + first, max(last - first, 0))
+
+        print(f"it took {(time.time() - start_time):.2f} sec to parse '{path}'")
+
+        return header, grid[:, columns]
+
+    # parse the text in blocks of rows
+    block = max(1, (1 << 22) // max(shape[1], 1))
+
+    for first in range(0, shape[0], block):
+        grid[first:first + block] = parse_ascii_grid_rows(path, header, header_lines + first, min(block, shape[0] - first))
+
+    grid.flush()
+    del grid
+
+    # rename only a complete sidecar, so a crash does not leave a broken one
+    os.replace(sidecar + ".tmp", sidecar)
+
+    print(f"it took {(time.time() - start_time):.2f} sec to parse '{path}'")
+
+    return header, np.load(sidecar, mmap_mode="r")[rows, columns]
+
+def parse_ascii_grid_rows(path, header, skip, count):
+
+    """
+    Parse count rows of an ESRI ASCII grid file after skipping the first skip lines.
+
+    Parameters:
+    - path (str): path of the .asc file
+    - header (dictonary): header of the file, see read_ascii_grid_header
+    - skip (int): number of lines before the first row, including the header
+    - count (int): number of rows
+
+    Returns:
+    - np.ndarray: (count, ncols) elevation values, cells with the nodata_value are NaN
+    """
+
+    with open(path, "r") as file:
+
+        try:
+            values = np.loadtxt(itertools.islice(file, skip, skip + count), dtype=float, ndmin=2)
+        except ValueError:
+            values = None
+
+    if values is None or values.shape != (count, header["ncols"]):
+
+        print(f"Not enough data in file")
+        quit()
+
+    if "nodata_value" in header:
+        values[values == header["nodata_value"]] = np.nan
+
+    return values
+
+def grid_window(instance, header):
+
+    """
+    Position of the area of the instance in the data file.
+
+    The area is instance.X x instance.Y pixels, shifted by instance.WINDOW = (x, y) pixels from
+    the bottom left corner of the data file. If instance.BBOX = (min longitude, min latitude,
+    max longitude, max latitude) is set, the area covers that bounding box instead, and
+    instance.WINDOW, instance.X and instance.Y are set accordingly. As in elevation_retriever,
+    the cellsize of the file is in meters.
+
+    Parameters:
+    - instance (module): instance configuration
+    - header (dictonary): header of the file, see read_ascii_grid_header
+
+    Returns:
+    - tuple: (first, last + 1) row of the area, the first row is the northern one
+    - tuple: (first, last + 1) column of the area
+    """
+
+    nrows = header["nrows"]
+    ncols = header["ncols"]
+
+    if instance.BBOX is not None:
+
+        min_lon, min_lat, max_lon, max_lat = instance.BBOX
+
+        # meters to degrees as in elevation_retriever
+        cell_size_lat = header["cellsize"] / 111320.0
+        cell_size_lon = header["cellsize"] / (111320.0 * cos(radians(header["yllcorner"] + nrows * cell_size_lat / 2)))
+
+        x = max(0, int(floor((min_lon - header["xllcorner"]) / cell_size_lon)))
+        y = max(0, int(floor((min_lat - header["yllcorner"]) / cell_size_lat)))
+
+        instance.WINDOW = (x, y)
+        instance.X = min(ncols, int(ceil((max_lon - header["xllcorner"]) / cell_size_lon))) - x
+        instance.Y = min(nrows, int(ceil((max_lat - header["yllcorner"]) / cell_size_lat))) - y
+
+        print(f"bounding box {instance.BBOX} is the area of {instance.X} x {instance.Y} pixels at {instance.WINDOW}")
+
+    x, y = instance.WINDOW if instance.WINDOW is not None else (0, 0)
+
+    if x < 0 or y < 0 or instance.X <= 0 or instance.Y <= 0 or x + instance.X > ncols or y + instance.Y > nrows:
+
+        print(f"The area of {instance.X} x {instance.Y} pixels at {(x, y)} is not in the data file")
+        quit()
+
+    return (nrows - y - instance.Y, nrows - y), (x, x + instance.X)
+
 def reading_in_ocean_data(instance):
 
     print(f"reading '{instance.DIR + instance.INPUT}'")
 
-    file = open(instance.DIR + "/" + instance.INPUT, "r")
-    elevation_data = file.read()
-    file.close()
+    path = instance.DIR + "/" + instance.INPUT
+
+    header, _ = read_ascii_grid_header(path)
 
-    ncols = int(re.search("ncols (.*)", elevation_data).group(1))
+    ncols = header["ncols"]
     print(f"number of columns: {ncols}")
 
-    nrows = int(re.search("nrows (.*)", elevation_data).group(1))
+    nrows = header["nrows"]
     print(f"number of rows: {nrows}")
 
-    latitude = float(re.search("xllcorner (.*)", elevation_data).group(1))
-    longitude = float(re.search("yllcorner (.*)", elevation_data).group(1))
-    resolution = float(re.search("cellsize (.*)", elevation_data).group(1))
+    latitude = header["xllcorner"]
+    longitude = header["yllcorner"]
+    resolution = header["cellsize"]
 
     print(f"resolution: {resolution}")
 
-    # remove header
-    elevation_data = re.split("\n+", elevation_data)[6:-1]
+    rows, columns = grid_window(instance, header)
 
-    if (nrows != len(elevation_data)):
+    _, grid = read_ascii_grid(path, rows, columns)
 
-        print(f"Not enough data in file")
-        quit()
+    # area of the instance indexed by [x, y], the first row is the southern one, cells without data are land
+    elevation = np.nan_to_num(grid[::-1].T, nan=0.0)
 
-    map = {}
-    ocean = {}
-    ocean_surface = {}
     min_depth = -11022.0
     max_depth = 0.0
     depth_layer_hight = 50
 
-    # depth up to 500m / 1640feet in 50m / 164feet steps
-    for z in range(0, 11, 1):
+    if (elevation < 0).any():
 
-        # dynamic dapth layer hight to max depth or 500m / 1640feet
-        if z == 1:
-            print(f"max depth: {max_depth}")
+        # the shallowest and the deepest ocean cell
+        min_depth = max(min_depth, float(elevation[elevation < 0].max()))
+        max_depth = min(max_depth, float(elevation[elevation < 0].min()))
 
-            if max_depth > -500:
+    print(f"max depth: {max_depth}")
 
-                # an suitable Periscope depth is 15m / 50ft and is a minimum depth layer hight depding on the max depth
-                depth_layer_hight = max(15, int(abs(max_depth / 10)))
+    # dynamic dapth layer hight to max depth or 500m / 1640feet
+    if max_depth > -500:
 
-        # for each line in the data
-        for y, line_str in enumerate(elevation_data[(nrows - instance.Y):nrows][::-1]):
-            
-            # for each element in the line
-            for x, element in enumerate(re.split("\s+", line_str)[:instance.X]):
+        # an suitable Periscope depth is 15m / 50ft and is a minimum depth layer hight depding on the max depth
+        depth_layer_hight = max(15, int(abs(max_depth / 10)))
 
-                element = float(element)
+    # depth up to 500m / 1640feet in 50m / 164feet steps
+    layers = np.arange(0, 11) * -1 * depth_layer_hight
+    occupancy = elevation[:, :, None] < layers[None, None, :]
 
-                # if needed, here has to be the code for avg of depths
+    # dictonaries in the order of depth, y and x
+    values = elevation.tolist()
+    map = {(x, y): values[x][y] for y in range(elevation.shape[1]) for x in range(elevation.shape[0])}
+    ocean = {(x, y, z): 1 for z, y, x in np.argwhere(occupancy.transpose(2, 1, 0)).tolist()}
+    ocean_surface = {(x, y, z): 1 for x, y, z in ocean if z == 0}
 
-                if z == 0:
+    return map, ocean, ocean_surface, min_depth, max_depth, depth_layer_hight, resolution, occupancy
 
-                    map[x,y] = element
+class DetectionTensor:
 
-                    if element < 0:
+    """
+    Sparse detection tensor, one entry per detection (target, theta, source, receiver).
 
-                        ocean_surface[x,y,z] = 1
+    The voxels are mapped to dense integer IDs: targets are numbered in the order of ocean,
+    sources and receivers in the order of ocean_surface and target angles in the order of
+    thetas. The incidence is stored as parallel int32 arrays sorted by (target, theta, source,
+    receiver), so all entries of one target and angle, and all receivers of one (target, theta,
+    source) row, are contiguous. row_start is the adjacency index of the rows: the receivers of
+    row (target * len(thetas) + theta) * len(surface) + source are the entries row_start[row] to
+    row_start[row + 1]. value is an optional float array, None means every entry is a sure
+    detection with value 1.
 
-                        # has to be 2 if statements if it is the case we have the max depth in the first element
-                        if element > min_depth:
+    For existing code it can also be read like the dictonary detection_prob keyed by
+    (tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z).
 
-                            min_depth = element
+    Parameters:
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+    - thetas (list): target angles in degree
+    - target (np.ndarray): target ID of every entry
+    - theta (np.ndarray): target angle ID of every entry
+    - source (np.ndarray): source ID of every entry
+    - receiver (np.ndarray): receiver ID of every entry
+    - value (np.ndarray): value of every entry, or None
+    """
 
-                        if element < max_depth:
+    def __init__(self, ocean, ocean_surface, thetas, target, theta, source, receiver, value=None):
 
-                            max_depth = element
+        self.targets = list(ocean.keys())
+        self.surface = list(ocean_surface.keys())
+        self.thetas = list(thetas)
 
-                if element < z * -1 * depth_layer_hight:
+        self.target_index = {key: i for i, key in enumerate(self.targets)}
+        self.surface_index = {key: i for i, key in enumerate(self.surface)}
+        self.theta_index = {theta: k for k, theta in enumerate(self.thetas)}
 
-                    ocean[x,y,z] = 1
-                   
-    return map, ocean, ocean_surface, min_depth, max_depth, depth_layer_hight, resolution
+        self.target_coords = np.array(self.targets, dtype=np.int32).reshape(-1, 3)
+        self.surface_coords = np.array(self.surface, dtype=np.int32).reshape(-1, 3)
+        self.theta_values = np.array(self.thetas, dtype=np.int32)
 
-def compute_coverage_triples(instance, ocean, ocean_surface, depth_layer_hight, resolution):
+        self.target = np.asarray(target, dtype=np.int32)
+        self.theta = np.asarray(theta, dtype=np.int32)
+        self.source = np.asarray(source, dtype=np.int32)
+        self.receiver = np.asarray(receiver, dtype=np.int32)
+        self.value = None if value is None else np.asarray(value, dtype=float)
 
-    # convert yards to meters
-    rho_0 = instance.RHO_0 * 0.9144
-    rb = instance.RB * 0.9144
+        code = self.encode(self.target, self.theta, self.source, self.receiver)
 
-    detection_prob = {}
+        if np.any(code[1:] <= code[:-1]):
 
-    start_time_coverage = time.time()
+            order = np.argsort(code, kind='stable')
+            code = code[order]
 
-    # for now in here but will be removed in the future.
+            self.target = self.target[order]
+            self.theta = self.theta[order]
+            self.source = self.source[order]
+            self.receiver = self.receiver[order]
 
-    if len(instance.TS) == 0: # without TS
+            if self.value is not None:
+                self.value = self.value[order]
 
-        for tar_x, tar_y, tar_z in ocean: # target
+        # integer-encoded keys, ascending
+        self.code = code
 
-            for tx_x, tx_y, tx_z in ocean_surface: # source
+        # first entry of every (target, theta, source) row
+        rows = len(self.targets) * len(self.thetas) * len(self.surface)
+        counts = np.bincount(code // max(len(self.surface), 1), minlength=rows)
 
-                for rx_x, rx_y, rx_z in ocean_surface: # receiver
+        self.row_start = np.zeros(rows + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.row_start[1:])
 
-                    # no obstacles between source-target and target-receiver, and source-reiver	
-                    if check_line(tx_x, tx_y, tx_z, tar_x, tar_y, tar_z, ocean) == None and check_line(tar_x, tar_y, tar_z, rx_x, rx_y, rx_z, ocean) == None:
+    @classmethod
+    def from_dict(cls, detection_prob, ocean, ocean_surface, thetas):
 
-                        if d(tx_x, tx_y, tx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) * d(rx_x, rx_y, rx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) <= rho_0**2 and d(tx_x, tx_y, tx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) + d(rx_x, rx_y, rx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) >= d(tx_x, tx_y, tx_z, rx_x, rx_y, rx_z, depth_layer_hight, resolution) + 2*rb: # check for inside range-of-day Cassini oval and outside direct-blast-effect
-                            
-                            detection_prob[tar_x, tar_y, tar_z, 0, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z] = 1 # sure detection
+        tensor = cls(ocean, ocean_surface, thetas, [], [], [], [])
 
-    else: # with TS
+        keys = list(detection_prob.keys())
 
-        for tar_x, tar_y, tar_z in ocean: # target
+        target = [tensor.target_index[key[0:3]] for key in keys]
+        theta = [tensor.theta_index[key[3]] for key in keys]
+        source = [tensor.surface_index[key[4:7]] for key in keys]
+        receiver = [tensor.surface_index[key[7:10]] for key in keys]
 
-            for tx_x, tx_y, tx_z in ocean_surface: # source
+        value = None
 
-                # here we have to add the depth of the source
+        if any(detection_prob[key] != 1 for key in keys):
+            value = [detection_prob[key] for key in keys]
 
-                if (tx_x, tx_y, tx_z) != (tar_x, tar_y, tar_z): # exclude of source and target in same position
-                    
-                    for rx_x, rx_y, rx_z in ocean_surface: # receiver
+        return cls(ocean, ocean_surface, thetas, target, theta, source, receiver, value)
 
-                        # here we have to add the depth of the receiver
+    def encode(self, target, theta, source, receiver):
 
-                        if (rx_x, rx_y, rx_z) != (tar_x, tar_y, tar_z): # exclude of reciever and target in same position
-                        
-                            # no obstacles between source-target and target-receiver, and source-reiver
-                            if check_line(tx_x, tx_y, tx_z, tar_x, tar_y, tar_z, ocean) == None and check_line(tar_x, tar_y, tar_z, rx_x, rx_y, rx_z, ocean) == None:
+        # one int64 per entry, ordered like (target, theta, source, receiver)
+        return ((np.asarray(target, dtype=np.int64) * len(self.thetas) + theta) * len(self.surface) + source) * len(self.surface) + receiver
 
-                                sqrt_tx_tar = 0.5 / ( sqrt((tx_x-tar_x)**2 + (tx_y-tar_y)**2 + (tx_z-tar_z)**2) )
-                                sqrt_rx_tar = 0.5 / ( sqrt((rx_x-tar_x)**2 + (rx_y-tar_y)**2 + (rx_z-tar_z)**2) )
+    def __len__(self):
 
-                                for theta in range(0, 180, instance.STEPS): # target angle
+        return len(self.code)
 
-                                    my_theta = theta / 180.0 * pi
-                                    my_sin_theta = sin(my_theta)
-                                    my_cos_theta = cos(my_theta)
-                                      
-                                    if d(tx_x, tx_y, tx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) + d(rx_x, rx_y, rx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) >= d(tx_x, tx_y, tx_z, rx_x, rx_y, rx_z, depth_layer_hight, resolution) + 2*rb: # check for outside direct-blast-effect
+    def values(self):
 
-                                        alpha = ( ((tx_x-tar_x) * my_cos_theta + (tx_y-tar_y) * my_sin_theta ) * sqrt_tx_tar + ((rx_x-tar_x) * my_cos_theta + (rx_y-tar_y) * my_sin_theta ) * sqrt_rx_tar )
+        if self.value is None:
+            return np.ones(len(self.code))
 
-                                        #print("target:",tar_x,tar_y,"angle:",theta,"source:",tx_x,tx_y,"receiver:",rx_x,rx_y,"E-angle:",alpha*180/pi,"TS:",g_cos(alpha))
+        return self.value
 
-                                        if d(tx_x, tx_y, tx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) * d(rx_x, rx_y, rx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) <= (rho_0 + g(alpha, instance))**2: # check for inside range-of-day Cassini oval
+    def find(self, key):
 
-                                            detection_prob[tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z] = 1 # sure detection
+        # position of the entry with the given 10-tuple key, -1 if there is none
+        try:
+            t = self.target_index[key[0:3]]
+            k = self.theta_index[key[3]]
+            i = self.surface_index[key[4:7]]
+            j = self.surface_index[key[7:10]]
+        except (KeyError, TypeError):
+            return -1
 
-                                            #print("target:",tar_x,tar_y,"angle:",theta,"source:",tx_x,tx_y,"receiver:",rx_x,rx_y,"E-angle:",alpha*180/pi,"TS:",g_cos(alpha))
+        code = ((t * len(self.thetas) + k) * len(self.surface) + i) * len(self.surface) + j
+        n = int(np.searchsorted(self.code, code))
 
-    end_time_coverage = time.time()
+        if n < len(self.code) and self.code[n] == code:
+            return n
 
-    print(f"it took {(end_time_coverage - start_time_coverage):.2f} sec to get {len(detection_prob)} detection triples")
+        return -1
 
-    return detection_prob
+    def __contains__(self, key):
 
-def compute_rowsum_detection_prob(instance, ocean, ocean_surface, detection_prob):
+        return self.find(key) >= 0
 
-    start_time_prob = time.time()
+    def __getitem__(self, key):
 
-    # Do we even need the detection_prob_rowsum_r?
+        n = self.find(key)
 
-    detection_prob_rowsum_r = {}
+        if n < 0:
+            raise KeyError(key)
 
-    max = -10e+10
-    min = 10e+10
+        if self.value is None:
+            return 1
 
-    for tar_x, tar_y, tar_z in ocean:
-        for theta in range(0,180,instance.STEPS): # target angle
-            for rx_x, rx_y, rx_z in ocean_surface:
-                sum = 0
-                for tx_x, tx_y, tx_z in ocean_surface:
+        return self.value[n].item()
 
-                    if (tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z) in detection_prob:
-                        sum = sum + detection_prob[tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z]
+    def __iter__(self):
 
-                detection_prob_rowsum_r[tar_x, tar_y, tar_z, theta, rx_x, rx_y, rx_z] = sum
+        block_size = 65536
 
-                if sum > max:
-                    max = sum
-                if sum < min:
-                    min = sum
+        for first in range(0, len(self.code), block_size):
 
-    if instance.BOUND == 1:
-            
-        for tar_x, tar_y, tar_z in ocean:
-            for theta in range(0,180,instance.STEPS): # target angle
-                for rx_x, rx_y, rx_z in ocean_surface:
+            keys = np.concatenate((self.target_coords[self.target[first:first + block_size]],
+                                   self.theta_values[self.theta[first:first + block_size], None],
+                                   self.surface_coords[self.source[first:first + block_size]],
+                                   self.surface_coords[self.receiver[first:first + block_size]]), axis=1)
 
-                    detection_prob_rowsum_r[tar_x, tar_y, tar_z, theta, rx_x, rx_y, rx_z] = max
+            yield from map(tuple, keys.tolist())
 
+    def keys(self):
 
-    detection_prob_rowsum_s = {}
+        return iter(self)
 
-    for tar_x, tar_y, tar_z in ocean:
-        for theta in range(0,180,instance.STEPS): # target angle
-            for tx_x, tx_y, tx_z in ocean_surface:
-                sum = 0
-                for rx_x, rx_y, rx_z in ocean_surface:
-                    if (tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z) in detection_prob:
-                        sum = sum + detection_prob[tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z]
+    def block(self, target, theta):
 
-                detection_prob_rowsum_s[tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z] = sum
+        # range of the entries of one target and target angle
+        row = (target * len(self.thetas) + theta) * len(self.surface)
 
-                if sum > max:
-                    max = sum
-                if sum < min:
-                    min = sum
+        return int(self.row_start[row]), int(self.row_start[row + len(self.surface)])
 
-    if instance.BOUND == 1:
-        for tar_x, tar_y, tar_z in ocean:
-            for theta in range(0,180,instance.STEPS): # target angle
-                for tx_x, tx_y, tx_z in ocean_surface:
+    def row(self, target, theta, source):
 
-                    detection_prob_rowsum_s[tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z] = max
+        # range of the entries of one (target, theta, source) row
+        row = (target * len(self.thetas) + theta) * len(self.surface) + source
+
+        return int(self.row_start[row]), int(self.row_start[row + 1])
+
+    def receivers(self, target, theta, source):
+
+        # receiver IDs of one (target, theta, source) row
+        first, last = self.row(target, theta, source)
+
+        return self.receiver[first:last]
+
+    @property
+    def nbytes(self):
+
+        nbytes = self.code.nbytes + self.row_start.nbytes + self.target.nbytes + self.theta.nbytes + self.source.nbytes + self.receiver.nbytes
+
+        if self.value is not None:
+            nbytes += self.value.nbytes
+
+        return nbytes
+
+def compute_visibility(ocean, ocean_surface, occupancy):
+
+    """
+    Compute the line of sight between every ocean surface pixel and every ocean pixel.
+
+    Each directed line is traced a single time. Since the Bresenham line from a to b is not
+    necessarily the same as the one from b to a, the source-to-target and the target-to-receiver
+    directions are stored separately.
+
+    Parameters:
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+    - occupancy (np.ndarray): boolean array of shape (X, Y, layers), True for ocean voxels
+
+    Returns:
+    - np.ndarray: visible_tx[i, t] is True if there is no obstacle from surface pixel i to ocean pixel t
+    - np.ndarray: visible_rx[i, t] is True if there is no obstacle from ocean pixel t to surface pixel i
+    """
+
+    start_time_visibility = time.time()
+
+    surface = np.array(list(ocean_surface.keys())).reshape(-1, 3)
+    targets = np.array(list(ocean.keys())).reshape(-1, 3)
+
+    visible_tx = np.zeros((len(surface), len(targets)), dtype=bool)
+    visible_rx = np.zeros((len(surface), len(targets)), dtype=bool)
+
+    # number of surface pixels per batch of lines, about a million lines at once
+    rows = max(1, 2**20 // max(1, len(targets)))
+
+    for first in range(0, len(surface), rows):
+
+        start = np.repeat(surface[first:first + rows], len(targets), axis=0)
+        end = np.tile(targets, (len(surface[first:first + rows]), 1))
+
+        visible_tx[first:first + rows] = ~check_lines(start, end, occupancy).reshape(-1, len(targets))
+        visible_rx[first:first + rows] = ~check_lines(end, start, occupancy).reshape(-1, len(targets))
+
+    end_time_visibility = time.time()
+
+    print(f"it took {(end_time_visibility - start_time_visibility):.2f} sec to trace {2 * visible_tx.size} lines of sight")
+
+    return visible_tx, visible_rx
+
+def covered_angles(target_strength, rho_0, projection, source, receiver, dist_product, block_size=1 << 20):
+
+    """
+    Cassini oval test of source-receiver pairs for all target angles in one vectorized pass.
+
+    The direct-blast test and the distances do not depend on the target angle, so they are done
+    before and only the remaining pairs are passed in. Pairs which are out of range for the largest
+    target strength are skipped, the others are processed in blocks of about block_size (pair,
+    angle) entries to bound the memory of the temporary arrays.
+
+    Parameters:
+    - target_strength (TargetStrength): target strength function
+    - rho_0 (float): range of the day in meters
+    - projection (np.ndarray): projection of the direction to every surface pixel on the target angles, divided by twice the distance, shape (surface pixels, thetas)
+    - source (np.ndarray): surface pixel of the source of every pair
+    - receiver (np.ndarray): surface pixel of the receiver of every pair
+    - dist_product (np.ndarray): product of the source-target and receiver-target distance of every pair
+
+    Returns:
+    - np.ndarray: detection of every pair at every target angle, shape (pairs, thetas)
+    """
+
+    mask = np.zeros((len(source), projection.shape[1]), dtype=bool)
+
+    # pairs which are out of range at every angle, with some slack for rounding
+    max_rho = max(abs(rho_0 + strength) for strength in [0.0] + target_strength.s.tolist())
+
+    reach = np.flatnonzero(dist_product <= max_rho**2 * (1 + 1e-9))
+
+    step = max(block_size // max(projection.shape[1], 1), 1)
+
+    for start in range(0, len(reach), step):
+
+        block = reach[start:start + step]
+
+        alpha = projection[source[block]] + projection[receiver[block]]
+
+        mask[block] = dist_product[block, None] <= (rho_0 + target_strength(alpha))**2
+
+    return mask
+
+def compute_coverage_triples(instance, ocean, ocean_surface, depth_layer_hight, resolution, visible_tx, visible_rx):
+
+    # convert yards to meters
+    rho_0 = instance.RHO_0 * 0.9144
+    rb = instance.RB * 0.9144
+
+    target_strength = TargetStrength(instance.TS)
+
+    detection_prob = {}
+
+    start_time_coverage = time.time()
+
+    # for now in here but will be removed in the future.
+
+    if len(instance.TS) == 0: # without TS
+
+        for t, (tar_x, tar_y, tar_z) in enumerate(ocean): # target
+
+            for i, (tx_x, tx_y, tx_z) in enumerate(ocean_surface): # source
+
+                for j, (rx_x, rx_y, rx_z) in enumerate(ocean_surface): # receiver
+
+                    # no obstacles between source-target and target-receiver, and source-reiver	
+                    if visible_tx[i, t] and visible_rx[j, t]:
+
+                        if d(tx_x, tx_y, tx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) * d(rx_x, rx_y, rx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) <= rho_0**2 and d(tx_x, tx_y, tx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) + d(rx_x, rx_y, rx_z, tar_x, tar_y, tar_z, depth_layer_hight, resolution) >= d(tx_x, tx_y, tx_z, rx_x, rx_y, rx_z, depth_layer_hight, resolution) + 2*rb: # check for inside range-of-day Cassini oval and outside direct-blast-effect
+                            
+                            detection_prob[tar_x, tar_y, tar_z, 0, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z] = 1 # sure detection
+
+    else: # with TS
+
+        surface = list(ocean_surface.keys())
+
+        thetas = list(range(0, 180, instance.STEPS))
+
+        # trigonometry of the target angles
+        cos_theta = [cos(theta / 180.0 * pi) for theta in thetas]
+        sin_theta = [sin(theta / 180.0 * pi) for theta in thetas]
+
+        # source-receiver distances, the same for every target
+        dist_tx_rx = [[d(tx_x, tx_y, tx_z, rx_x, rx_y, rx_z, depth_layer_hight, resolution) for (rx_x, rx_y, rx_z) in surface] for (tx_x, tx_y, tx_z) in surface]
+
+        for t, (tar_x, tar_y, tar_z) in enumerate(ocean): # target
+
+            # distance to the target and projection on the target angles, once per source or receiver
+            dist_tar = []
+            projection = []
+
+            for (x, y, z) in surface:
+
+                dist_tar.append(d(x, y, z, tar_x, tar_y, tar_z, depth_layer_hight, resolution))
+
+                if (x, y, z) != (tar_x, tar_y, tar_z):
+                    sqrt_tar = 0.5 / ( sqrt((x-tar_x)**2 + (y-tar_y)**2 + (z-tar_z)**2) )
+                    projection.append([((x-tar_x) * my_cos_theta + (y-tar_y) * my_sin_theta) * sqrt_tar for my_cos_theta, my_sin_theta in zip(cos_theta, sin_theta)])
+                else:
+                    projection.append([0.0] * len(thetas))
+
+            pair_tx = []
+            pair_rx = []
+
+            for i, (tx_x, tx_y, tx_z) in enumerate(surface): # source
+
+                # here we have to add the depth of the source
+
+                if (tx_x, tx_y, tx_z) != (tar_x, tar_y, tar_z): # exclude of source and target in same position
+
+                    for j, (rx_x, rx_y, rx_z) in enumerate(surface): # receiver
+
+                        # here we have to add the depth of the receiver
+
+                        if (rx_x, rx_y, rx_z) != (tar_x, tar_y, tar_z): # exclude of reciever and target in same position
+
+                            # no obstacles between source-target and target-receiver, and source-reiver
+                            if visible_tx[i, t] and visible_rx[j, t]:
+
+                                if dist_tar[i] + dist_tar[j] >= dist_tx_rx[i][j] + 2*rb: # check for outside direct-blast-effect, the same for every angle
+
+                                    pair_tx.append(i)
+                                    pair_rx.append(j)
+
+            pair_tx = np.array(pair_tx, dtype=np.int64)
+            pair_rx = np.array(pair_rx, dtype=np.int64)
+
+            dist_tar = np.array(dist_tar)
+
+            # check for inside range-of-day Cassini oval, all target angles at once
+            mask = covered_angles(target_strength, rho_0, np.array(projection).reshape(-1, len(thetas)), pair_tx, pair_rx, dist_tar[pair_tx] * dist_tar[pair_rx])
+
+            for p, k in zip(*np.nonzero(mask)):
+
+                detection_prob[(tar_x, tar_y, tar_z, thetas[k]) + surface[pair_tx[p]] + surface[pair_rx[p]]] = 1 # sure detection
+
+    detection_prob = DetectionTensor.from_dict(detection_prob, ocean, ocean_surface, range(0, 180, instance.STEPS))
+
+    end_time_coverage = time.time()
+
+    print(f"it took {(end_time_coverage - start_time_coverage):.2f} sec to get {len(detection_prob)} detection triples")
+
+    return detection_prob
+
+def coverage_grows(instance, rho_0, rb):
+
+    """
+    Check if the detections with another RHO_0 and RB are all detections of an instance.
+
+    A detection needs the direct-blast test with rb and the Cassini oval test with
+    (rho_0 + TS(alpha))^2. For the same TS and STEPS a smaller rb and, as long as rho_0 plus the
+    smallest target strength is not negative, a larger rho_0 only add detections. The line of
+    sight and the distances do not depend on them.
+
+    Parameters:
+    - instance (module): instance configuration
+    - rho_0 (float): range of the day of the other detections (in yards)
+    - rb (float): pulse length of the other detections (in yards)
+
+    Returns:
+    - bool: True if the other detections are contained in the ones of the instance
+    """
+
+    min_strength = min([0.0] + [strength * 0.9144 for angle, strength in instance.TS])
+
+    # some slack, so rounding of the target strength cannot change the sign
+    return instance.RHO_0 >= rho_0 and instance.RB <= rb and rho_0 * 0.9144 + min_strength > 1e-6
+
+def known_angles(detection_prob, t, candidates, source, receiver):
+
+    # detections of target t in detection_prob as mask of the pairs (candidates[source], candidates[receiver]) and the angles
+    mask = np.zeros((len(source), len(detection_prob.thetas)), dtype=bool)
+
+    # the entries of target t are contiguous, see DetectionTensor.row_start
+    rows = len(detection_prob.thetas) * len(detection_prob.surface)
+    first = detection_prob.row_start[t * rows]
+    last = detection_prob.row_start[(t + 1) * rows]
+
+    position = np.full(len(detection_prob.surface), -1, dtype=np.int64)
+    position[candidates] = np.arange(len(candidates))
+
+    known_source = position[detection_prob.source[first:last]]
+    known_receiver = position[detection_prob.receiver[first:last]]
+    known_theta = detection_prob.theta[first:last]
+
+    keep = (known_source >= 0) & (known_receiver >= 0)
+
+    # row of every pair of candidates, -1 for the pairs which are not passed in
+    pair_row = np.full(len(candidates) * len(candidates), -1, dtype=np.int64)
+    pair_row[source * len(candidates) + receiver] = np.arange(len(source))
+
+    row = pair_row[known_source[keep] * len(candidates) + known_receiver[keep]]
+
+    mask[row[row >= 0], known_theta[keep][row >= 0]] = True
+
+    return mask
+
+class SurfaceGrid:
+
+    """
+    Grid bucket index of the ocean surface pixels for range queries around a target.
+
+    The surface pixels are put into a 3D array of their indices, so the pixels within a
+    horizontal distance of a target are a slice of the array, and the work of a query grows
+    with the number of pixels in range instead of the number of all surface pixels.
+
+    Parameters:
+    - surface (np.ndarray): coordinates of the ocean surface pixels, shape (surface pixels, 3)
+    - depth_layer_hight (int): hight of a depth layer in meters
+    - resolution (float): size of a pixel in meters
+    """
+
+    def __init__(self, surface, depth_layer_hight, resolution):
+
+        self.surface = surface
+        self.depth_layer_hight = depth_layer_hight
+        self.resolution = resolution
+
+        self.low = surface.min(axis=0) if len(surface) else np.zeros(3, dtype=np.int64)
+        high = surface.max(axis=0) if len(surface) else np.zeros(3, dtype=np.int64)
+
+        self.index = np.full(high - self.low + 1, -1, dtype=np.int64)
+        self.index[tuple((surface - self.low).T)] = np.arange(len(surface))
+
+        # depth layers of the surface pixels
+        self.layers = np.unique(surface[:, 2])
+
+    def min_distance(self, target, exclude_target):
+
+        # lower bound of the distance between the target and any surface pixel, only the depth layers are compared
+        gap = np.abs(self.layers - target[2]).min() * self.depth_layer_hight if len(self.layers) else 0.0
+
+        if gap == 0 and exclude_target:
+            # every other pixel is at least one pixel or one depth layer away
+            gap = min(self.resolution, self.depth_layer_hight)
+
+        return gap
+
+    def candidates(self, target, min_range, max_range):
+
+        """
+        Surface pixels between min_range and max_range meters from target.
+
+        Returns:
+        - np.ndarray: ascending indices of the surface pixels
+        """
+
+        if max_range == inf:
+            return np.arange(len(self.surface))
+
+        reach = int(max_range // self.resolution) + 1
+
+        first = np.maximum(np.array([target[0] - reach, target[1] - reach]) - self.low[:2], 0)
+        last = np.array([target[0] + reach, target[1] + reach]) - self.low[:2] + 1
+
+        ids = self.index[first[0]:max(first[0], last[0]), first[1]:max(first[1], last[1])].ravel()
+        ids = np.sort(ids[ids >= 0])
+
+        position = self.surface[ids]
+
+        dist = np.sqrt((self.resolution * position[:, 0] - self.resolution * target[0])**2 + (self.resolution * position[:, 1] - self.resolution * target[1])**2 + (self.depth_layer_hight * position[:, 2] - self.depth_layer_hight * target[2])**2)
+
+        return ids[(dist >= min_range) & (dist <= max_range)]
+
+def coverage_of_targets(instance, targets, target_ids, surface, depth_layer_hight, resolution, visible_tx, visible_rx, previous=None):
+
+    """
+    Detections of some targets, the loop over the targets of compute_coverage_triples_numpy.
+
+    previous are detections of the same area with a smaller RHO_0 or a larger RB, which are all
+    detections of the instance, see coverage_grows. Then only the pairs which were not detected at
+    every target angle are tested with TS. Without TS there is nothing to save, all pairs are
+    tested.
+
+    Parameters:
+    - instance (module): instance configuration, only RHO_0, RB, TS and STEPS are used
+    - targets (np.ndarray): coordinates of the targets, shape (targets, 3)
+    - target_ids (np.ndarray): index of every target in ocean
+    - surface (np.ndarray): coordinates of the ocean surface pixels, shape (surface pixels, 3)
+    - depth_layer_hight (int): hight of a depth layer in meters
+    - resolution (float): size of a pixel in meters
+    - visible_tx (np.ndarray): line of sight from surface pixels to the targets, one column per target
+    - visible_rx (np.ndarray): line of sight from the targets to surface pixels, one column per target
+    - previous (DetectionTensor): detections contained in the ones of the instance, or None
+
+    Returns:
+    - tuple: target, theta, source and receiver of the detections as np.ndarray
+    """
+
+    # convert yards to meters
+    rho_0 = instance.RHO_0 * 0.9144
+    rb = instance.RB * 0.9144
+
+    target_strength = TargetStrength(instance.TS)
+
+    tensor_target = [np.zeros(0, dtype=np.int32)]
+    tensor_theta = [np.zeros(0, dtype=np.int32)]
+    tensor_source = [np.zeros(0, dtype=np.int32)]
+    tensor_receiver = [np.zeros(0, dtype=np.int32)]
+
+    if len(instance.TS) == 0: # without TS
+        thetas = [0]
+    else: # with TS
+        thetas = list(range(0, 180, instance.STEPS))
+
+    # trigonometry of the target angles
+    cos_theta = np.array([cos(theta / 180.0 * pi) for theta in thetas])
+    sin_theta = np.array([sin(theta / 180.0 * pi) for theta in thetas])
+
+    # largest range of the day, over all target strengths
+    max_rho = max(abs(rho_0 + strength) for strength in [0.0] + target_strength.s.tolist())
+
+    grid = SurfaceGrid(surface, depth_layer_hight, resolution)
+
+    dist_all = None
+
+    for n, (t, (tar_x, tar_y, tar_z)) in enumerate(zip(target_ids.tolist(), targets.tolist())): # target
+
+        # Sources and receivers closer than rb to the target fail the direct-blast test, since the
+        # distance between them is at least the difference of their distances to the target. The
+        # partner is at least max(rb, min distance) away, so with the Cassini oval a source or
+        # receiver is at most max_rho^2 / max(rb, min distance) away. The bounds have some slack
+        # for rounding, the tests below are exact.
+        min_range = max(rb, grid.min_distance((tar_x, tar_y, tar_z), len(instance.TS) > 0))
+        max_range = max_rho**2 / min_range * (1 + 1e-9) + 1e-6 if min_range > 0 else inf
+
+        candidates = grid.candidates((tar_x, tar_y, tar_z), rb * (1 - 1e-9) - 1e-6, max_range)
+
+        surface_x = surface[candidates, 0]
+        surface_y = surface[candidates, 1]
+        surface_z = surface[candidates, 2]
+
+        # source-receiver distances, computed once if every surface pixel is in range
+        if len(candidates) == len(surface) and dist_all is not None:
+            dist_tx_rx = dist_all
+        else:
+            dist_tx_rx = np.sqrt((resolution * surface_x[:, None] - resolution * surface_x[None, :])**2 + (resolution * surface_y[:, None] - resolution * surface_y[None, :])**2 + (depth_layer_hight * surface_z[:, None] - depth_layer_hight * surface_z[None, :])**2)
+
+            if len(candidates) == len(surface):
+                dist_all = dist_tx_rx
+
+        # no obstacles between source-target and target-receiver
+        visible_tar_tx = visible_tx[candidates, n]
+        visible_tar_rx = visible_rx[candidates, n]
+
+        # distance between target and every surface pixel, used for source and receiver alike
+        dist_tar = np.sqrt((resolution * surface_x - resolution * tar_x)**2 + (resolution * surface_y - resolution * tar_y)**2 + (depth_layer_hight * surface_z - depth_layer_hight * tar_z)**2)
+
+        # check for outside direct-blast-effect
+        pair_mask = dist_tar[:, None] + dist_tar[None, :] >= dist_tx_rx + 2*rb
+
+        if len(instance.TS) == 0: # without TS
+
+            pair_mask &= visible_tar_tx[:, None] & visible_tar_rx[None, :]
+
+            # check for inside range-of-day Cassini oval
+            pair_mask &= dist_tar[:, None] * dist_tar[None, :] <= rho_0**2
+
+            i, j = np.nonzero(pair_mask)
+            k = np.zeros(len(i), dtype=np.int64)
+
+        else: # with TS
+
+            # exclude of source/receiver and target in same position
+            not_target = (surface_x != tar_x) | (surface_y != tar_y) | (surface_z != tar_z)
+
+            visible_tar_tx &= not_target
+            visible_tar_rx &= not_target
+
+            pair_mask &= visible_tar_tx[:, None] & visible_tar_rx[None, :]
+
+            # the pairs which pass the tests that do not depend on the target angle
+            i, j = np.nonzero(pair_mask)
+
+            diff_x = surface_x - tar_x
+            diff_y = surface_y - tar_y
+            diff_z = surface_z - tar_z
+
+            norm_tar = np.sqrt(diff_x**2 + diff_y**2 + diff_z**2)
+            sqrt_tar = np.divide(0.5, norm_tar, out=np.zeros(len(candidates)), where=not_target)
+
+            projection = (diff_x[:, None] * cos_theta[None, :] + diff_y[:, None] * sin_theta[None, :]) * sqrt_tar[:, None]
+
+            if previous is None:
+
+                # check for inside range-of-day Cassini oval, all target angles at once
+                mask = covered_angles(target_strength, rho_0, projection, i, j, dist_tar[i] * dist_tar[j])
+
+            else:
+
+                mask = known_angles(previous, t, candidates, i, j)
+
+                # detections can only be added, so the pairs which were detected at every angle are done
+                rows = np.flatnonzero(~mask.all(axis=1))
+
+                mask[rows] |= covered_angles(target_strength, rho_0, projection, i[rows], j[rows], dist_tar[i[rows]] * dist_tar[j[rows]])
+
+            # sure detections, in the order (theta, source, receiver)
+            k, p = np.nonzero(mask.T)
+
+            i = i[p]
+            j = j[p]
+
+        tensor_target.append(np.full(len(k), t, dtype=np.int32))
+        tensor_theta.append(k.astype(np.int32))
+        tensor_source.append(candidates[i].astype(np.int32))
+        tensor_receiver.append(candidates[j].astype(np.int32))
+
+    return np.concatenate(tensor_target), np.concatenate(tensor_theta), np.concatenate(tensor_source), np.concatenate(tensor_receiver)
+
+def coverage_blocks(instance, ocean, ocean_surface, depth_layer_hight, resolution, visible_tx, visible_rx, previous=None):
+
+    """
+    Detections of compute_coverage_triples_numpy as a stream of blocks of targets.
+
+    The targets are split into consecutive blocks of about a million (target, surface pixel)
+    pairs, and the detections of a block are only computed when the consumer asks for it. So the
+    row sums and the model can be built block by block, without the whole detection tensor.
+
+    Parameters:
+    - instance (module): instance configuration
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+    - depth_layer_hight (int): hight of a depth layer in meters
+    - resolution (float): size of a pixel in meters
+    - visible_tx (np.ndarray): line of sight from surface pixels to ocean pixels, see compute_visibility
+    - visible_rx (np.ndarray): line of sight from ocean pixels to surface pixels, see compute_visibility
+    - previous (DetectionTensor): detections contained in the ones of the instance, see coverage_of_targets
+
+    Yields:
+    - tuple: first and last (exclusive) target of the block and target, theta, source and receiver of its detections as np.ndarray, ordered like DetectionTensor
+    """
+
+    surface = np.array(list(ocean_surface.keys())).reshape(-1, 3)
+    targets = np.array(list(ocean.keys())).reshape(-1, 3)
+
+    size = max(1, 2**20 // max(1, len(surface)))
+
+    for first in range(0, len(targets), size):
+
+        last = min(first + size, len(targets))
+
+        yield (first, last) + coverage_of_targets(instance, targets[first:last], np.arange(first, last), surface, depth_layer_hight, resolution, visible_tx[:, first:last], visible_rx[:, first:last], previous)
+
+def compute_coverage_triples_numpy(instance, ocean, ocean_surface, depth_layer_hight, resolution, visible_tx, visible_rx, previous=None):
+
+    """
+    Vectorized version of compute_coverage_triples.
+
+    The coordinates of ocean_surface are put into arrays once and, for one target at a time,
+    the direct-blast and Cassini oval tests are evaluated as broadcast array operations for the
+    source-receiver pairs within the largest possible range, which are found in a SurfaceGrid.
+    The target angles are only checked for the pairs which pass the direct-blast test, in one
+    pass with covered_angles. The detections are collected as integer IDs, without going through
+    tuples, and have exactly the same keys as the ones of compute_coverage_triples.
+
+    Parameters:
+    - instance (module): instance configuration
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+    - depth_layer_hight (int): hight of a depth layer in meters
+    - resolution (float): size of a pixel in meters
+    - visible_tx (np.ndarray): line of sight from surface pixels to ocean pixels, see compute_visibility
+    - visible_rx (np.ndarray): line of sight from ocean pixels to surface pixels, see compute_visibility
+    - previous (DetectionTensor): detections contained in the ones of the instance, see coverage_of_targets
+
+    Returns:
+    - DetectionTensor: detection_prob
+    """
+
+    start_time_coverage = time.time()
+
+    blocks = list(coverage_blocks(instance, ocean, ocean_surface, depth_layer_hight, resolution, visible_tx, visible_rx, previous))
+
+    target, theta, source, receiver = (np.concatenate([np.zeros(0, dtype=np.int32)] + [block[n] for block in blocks]) for n in range(2, 6))
+
+    detection_prob = DetectionTensor(ocean, ocean_surface, range(0, 180, instance.STEPS), target, theta, source, receiver)
+
+    end_time_coverage = time.time()
+
+    print(f"it took {(end_time_coverage - start_time_coverage):.2f} sec to get {len(detection_prob)} detection triples")
+
+    return detection_prob
+
+def coverage_workers(instance):
+
+    """
+    Number of processes for the coverage: COVERAGE_WORKERS, or with COVERAGE_WORKERS = 0 the
+    cores of the SLURM job (SLURM_CPUS_PER_TASK), or 1 outside of SLURM.
+
+    Parameters:
+    - instance (module): instance configuration
+
+    Returns:
+    - int: number of processes
+    """
+
+    if instance.COVERAGE_WORKERS > 0:
+        return instance.COVERAGE_WORKERS
+
+    return int(os.environ.get("SLURM_CPUS_PER_TASK", 1))
+
+# shared arrays of a worker process of the coverage
+coverage_worker = {}
+
+def share_array(array):
+
+    # copy array into a new shared memory block, the workers attach it by its name
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+def init_coverage_worker(parameters, depth_layer_hight, resolution, arrays):
+
+    coverage_worker['parameters'] = parameters
+    coverage_worker['depth_layer_hight'] = depth_layer_hight
+    coverage_worker['resolution'] = resolution
+
+    for name, (shm_name, shape, dtype) in arrays.items():
+
+        shm = shared_memory.SharedMemory(name=shm_name)
+
+        # keep the block open as long as the worker uses the array
+        coverage_worker[name + '_shm'] = shm
+        coverage_worker[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def run_coverage_chunk(bounds):
+
+    first, last = bounds
+
+    surface = coverage_worker['surface']
+    targets = coverage_worker['targets'][first:last]
+    occupancy = coverage_worker['occupancy']
+
+    # line of sight between the surface and the targets of the chunk, as in compute_visibility
+    start = np.repeat(surface, len(targets), axis=0)
+    end = np.tile(targets, (len(surface), 1))
+
+    visible_tx = ~check_lines(start, end, occupancy).reshape(len(surface), len(targets))
+    visible_rx = ~check_lines(end, start, occupancy).reshape(len(surface), len(targets))
+
+    return coverage_of_targets(coverage_worker['parameters'], targets, np.arange(first, last), surface, coverage_worker['depth_layer_hight'], coverage_worker['resolution'], visible_tx, visible_rx)
+
+def coverage_blocks_parallel(instance, ocean, ocean_surface, depth_layer_hight, resolution, occupancy, workers):
+
+    """
+    Parallel version of compute_visibility and coverage_blocks.
+
+    The targets are split into chunks, and the line of sight and the detections of every chunk
+    are computed in a pool of processes. The occupancy grid and the coordinates are put into
+    shared memory once instead of being pickled for every chunk. The workers return the
+    detections of their chunk as integer arrays, which are passed on in the order of the
+    targets. At most two chunks per worker are computed ahead of the consumer, so the finished
+    chunks do not pile up while the consumer is busy.
+
+    Parameters:
+    - instance (module): instance configuration
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+    - depth_layer_hight (int): hight of a depth layer in meters
+    - resolution (float): size of a pixel in meters
+    - occupancy (np.ndarray): boolean array of shape (X, Y, layers), True for ocean voxels
+    - workers (int): number of processes
+
+    Yields:
+    - tuple: first and last (exclusive) target of the chunk and target, theta, source and receiver of its detections, see coverage_blocks
+    """
+
+    surface = np.array(list(ocean_surface.keys()), dtype=np.int64).reshape(-1, 3)
+    targets = np.array(list(ocean.keys()), dtype=np.int64).reshape(-1, 3)
+
+    # the physical parameters, so the workers do not need the cfg module
+    parameters = types.SimpleNamespace(RHO_0=instance.RHO_0, RB=instance.RB, TS=list(instance.TS), STEPS=instance.STEPS)
+
+    # about four chunks per worker for the load balance and at most about a million lines of sight per chunk
+    size = max(1, min(-(-len(targets) // (4 * workers)), 2**20 // max(1, len(surface))))
+    chunks = [(first, min(first + size, len(targets))) for first in range(0, len(targets), size)]
+
+    blocks = {}
+    arrays = {}
+
+    try:
+
+        for name, array in (("occupancy", occupancy), ("surface", surface), ("targets", targets)):
+            blocks[name], arrays[name] = share_array(np.ascontiguousarray(array))
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'), initializer=init_coverage_worker, initargs=(parameters, depth_layer_hight, resolution, arrays)) as executor:
+
+            pending = collections.deque()
+
+            for bounds in chunks:
+
+                pending.append((bounds, executor.submit(run_coverage_chunk, bounds)))
+
+                if len(pending) > 2 * workers:
+                    bounds, future = pending.popleft()
+                    yield bounds + future.result()
+
+            while pending:
+                bounds, future = pending.popleft()
+                yield bounds + future.result()
+
+    finally:
+
+        for shm in blocks.values():
+            shm.close()
+            shm.unlink()
+
+def compute_coverage_triples_parallel(instance, ocean, ocean_surface, depth_layer_hight, resolution, occupancy, workers):
+
+    """
+    Parallel version of compute_visibility and compute_coverage_triples_numpy.
+
+    The detections of the chunks of coverage_blocks_parallel are concatenated in the order of the
+    targets. The detection triples are the same as the ones of compute_coverage_triples_numpy.
+
+    Parameters:
+    - instance (module): instance configuration
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+    - depth_layer_hight (int): hight of a depth layer in meters
+    - resolution (float): size of a pixel in meters
+    - occupancy (np.ndarray): boolean array of shape (X, Y, layers), True for ocean voxels
+    - workers (int): number of processes
+
+    Returns:
+    - DetectionTensor: detection_prob
+    """
+
+    start_time_coverage = time.time()
+
+    results = list(coverage_blocks_parallel(instance, ocean, ocean_surface, depth_layer_hight, resolution, occupancy, workers))
+
+    target, theta, source, receiver = (np.concatenate([np.zeros(0, dtype=np.int32)] + [result[n] for result in results]) for n in range(2, 6))
+
+    detection_prob = DetectionTensor(ocean, ocean_surface, range(0, 180, instance.STEPS), target, theta, source, receiver)
+
+    end_time_coverage = time.time()
+
+    print(f"it took {(end_time_coverage - start_time_coverage):.2f} sec to trace {2 * len(ocean_surface) * len(ocean)} lines of sight and get {len(detection_prob)} detection triples in {workers} processes, {len(results)} chunks")
+
+    return detection_prob
+
+class RowSums:
+
+    """
+    Row sums of the detection tensor, accumulated from blocks of targets.
+
+    sums_s[(target * thetas + theta) * surface + source] is the number (or the sum of the values)
+    of the receivers which detect target at angle theta together with source, and sums_r the same
+    over the sources for a receiver. Every block adds the rows of its own targets with one
+    np.bincount, so the blocks can come from coverage_blocks and be dropped afterwards.
+
+    Parameters:
+    - targets (int): number of ocean pixels
+    - thetas (int): number of target angles
+    - surface (int): number of ocean surface pixels
+    - weighted (bool): the detections have values, the sums are float
+    """
+
+    def __init__(self, targets, thetas, surface, weighted=False):
+
+        self.thetas = thetas
+        self.surface = surface
+
+        self.sums_r = np.zeros(targets * thetas * surface, dtype=float if weighted else np.int64)
+        self.sums_s = np.zeros(targets * thetas * surface, dtype=float if weighted else np.int64)
+
+    def add(self, first, last, target, theta, source, receiver, value=None):
+
+        rows = self.thetas * self.surface
+
+        # encoded (target, theta, surface) ID of every detection, relative to the first target of the block
+        row = ((target.astype(np.int64) - first) * self.thetas + theta) * self.surface
+
+        self.sums_r[first * rows:last * rows] += np.bincount(row + receiver, weights=value, minlength=(last - first) * rows).astype(self.sums_r.dtype)
+        self.sums_s[first * rows:last * rows] += np.bincount(row + source, weights=value, minlength=(last - first) * rows).astype(self.sums_s.dtype)
+
+    def bound_s(self, bound):
+
+        # bound of the y variables: the row sums over the receivers, or with bound == 1 the maximum over both row sums
+        if bound == 1:
+            return np.full(len(self.sums_s), max(self.sums_r.max().item(), self.sums_s.max().item()) if len(self.sums_s) else 0)
+
+        return self.sums_s
+
+def compute_rowsum_detection_prob(instance, ocean, ocean_surface, detection_prob, rowsum_r=False):
+
+    """
+    Row sums of the detection tensor.
+
+    detection_prob_rowsum_s[tar, theta, tx] is the number (or the sum of the values) of the
+    receivers which detect target tar at angle theta together with source tx, and
+    detection_prob_rowsum_r[tar, theta, rx] the same over the sources for receiver rx. Both are
+    computed with RowSums, one np.bincount over the encoded (target, theta, source) and (target, theta,
+    receiver) IDs of the detections. With instance.BOUND == 1 every row sum is replaced by the
+    maximum, where the bound of detection_prob_rowsum_s is the maximum over both row sums.
+    detection_prob_rowsum_r is not used by the model, so it is only built if rowsum_r is set.
+
+    Parameters:
+    - instance (module): instance configuration
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+    - detection_prob (DetectionTensor): detection triples
+    - rowsum_r (bool): build detection_prob_rowsum_r as well
+
+    Returns:
+    - dictonary: detection_prob_rowsum_r keyed by (tar_x, tar_y, tar_z, theta, rx_x, rx_y, rx_z), or None
+    - dictonary: detection_prob_rowsum_s keyed by (tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z)
+    """
+
+    start_time_prob = time.time()
+
+    thetas = list(range(0,180,instance.STEPS)) # target angle
+
+    rows = len(ocean) * len(thetas) * len(ocean_surface)
+
+    # the whole tensor as one block, the rows are in the order of the keys
+    sums = RowSums(len(ocean), len(thetas), len(ocean_surface), detection_prob.value is not None)
+    sums.add(0, len(ocean), detection_prob.target, detection_prob.theta, detection_prob.source, detection_prob.receiver, detection_prob.value)
+
+    sums_r = sums.sums_r
+    sums_s = sums.sums_s
+
+    keys = [tar + (theta,) + sur for tar in ocean for theta in thetas for sur in ocean_surface]
+
+    detection_prob_rowsum_r = None
+
+    if rowsum_r:
+
+        if instance.BOUND == 1:
+            detection_prob_rowsum_r = dict.fromkeys(keys, sums_r.max().item() if rows else 0)
+        else:
+            detection_prob_rowsum_r = dict(zip(keys, sums_r.tolist()))
+
+    if instance.BOUND == 1:
+        detection_prob_rowsum_s = dict.fromkeys(keys, max(sums_r.max().item(), sums_s.max().item()) if rows else 0)
+    else:
+        detection_prob_rowsum_s = dict(zip(keys, sums_s.tolist()))
 
     end_time_prob = time.time()
 
     print(f"It took {(end_time_prob - start_time_prob):.2f} sec to calc detection prob")
 
-    return detection_prob_rowsum_r, detection_prob_rowsum_s
\ No newline at end of file
+    return detection_prob_rowsum_r, detection_prob_rowsum_s
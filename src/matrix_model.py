@@ -0,0 +1,661 @@
+import time
+
+import numpy as np
+
+from src.functions import DetectionTensor, RowSums
+
+class MatrixModel:
+
+    """
+    The optimization model of create_optimization_model as sparse matrices.
+
+    The model is assembled straight from the detection tensor with NumPy, without building a
+    Pyomo expression per term. The columns are the variables s and r for every surface cell, c
+    for every ocean cell (only for GOAL == 1) and y for every detection key (target, theta,
+    source). The rows are the constraints in the order of the Pyomo model: the number of sources
+    and receivers, the coverage constraints for every (target, theta) and the linearization
+    constraints for every detection key. The constraint matrix is stored in CSR format
+    (indptr, indices, data).
+
+    With lazy, the y columns, the coverage constraints and the linearization constraints are left
+    out and the coverage is separated on demand in the callbacks of solve_matrix_model. Only the
+    coverage constraints of the (target, theta) which no pair detects stay in the model.
+
+    MatrixModel.from_blocks builds the same model from the blocks of coverage_blocks while they
+    are computed, without the detection tensor and the row sum dictonary.
+
+    After solve_matrix_model, s, r and c are dictonaries of the solution values keyed by the
+    coordinates, so the model can be passed to output_solution like a Pyomo model.
+
+    Parameters:
+    - instance (module): instance configuration
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+    - ocean (dictonary): 3D dictonary representing ocean
+    - detection_prob_rowsum_s (dictonary): row sums keyed by (tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z) in the order of compute_rowsum_detection_prob
+    - detection_prob (DetectionTensor): detection triples
+    - lazy (bool): leave the coverage to the callbacks
+    """
+
+    def __init__(self, instance, ocean_surface, ocean, detection_prob_rowsum_s, detection_prob, lazy=False):
+
+        start_time_model = time.time()
+
+        self.surface = list(ocean_surface.keys())
+        self.targets = list(ocean.keys())
+        self.thetas = list(range(0, 180, instance.STEPS))
+        self.detection_keys = [] if lazy else list(detection_prob_rowsum_s.keys())
+        self.detection_prob = detection_prob
+        self.goal = instance.GOAL
+        self.lazy = lazy
+
+        S = len(self.surface)
+        T = len(self.targets)
+        K = len(self.thetas)
+        Y = len(self.detection_keys)
+
+        if not lazy and Y != T * K * S:
+            raise ValueError(f"expected {T * K * S} detection keys, got {Y}")
+
+        rowsum = np.fromiter(detection_prob_rowsum_s.values(), dtype=float, count=Y)
+
+        # VARIABLES and OBJECTIVE
+        self.set_columns(instance, rowsum)
+
+        columns = len(self.obj)
+
+        # CONSTRAINTS as (row, column, value) triples
+        rows = []
+        cols = []
+        vals = []
+
+        surface_ids = np.arange(S)
+        key_ids = np.arange(Y)
+
+        # number of sources and receivers
+        rows += [np.zeros(S, dtype=np.int64), np.ones(S, dtype=np.int64)]
+        cols += [self.s_col + surface_ids, self.r_col + surface_ids]
+        vals += [np.ones(S), np.ones(S)]
+
+        if instance.GOAL == 0:
+            rhs = [1.0, 1.0]
+            senses = "GG"
+        else:
+            rhs = [float(instance.S), float(instance.R)]
+            senses = "EE"
+
+        # coverage constraints for every (target, theta), the detection keys are ordered by (target, theta, source)
+        coverage_row = 2
+        coverage = coverage_row + key_ids // S
+
+        if lazy:
+
+            # (target, theta) which no pair detects, their coverage constraint has no s and y
+            self.coverage_keys = np.flatnonzero(detection_prob.row_start[S::S] == detection_prob.row_start[:-1:S])
+
+        else:
+
+            self.coverage_keys = np.arange(T * K)
+
+            rows += [coverage, coverage]
+            cols += [self.s_col + key_ids % S, self.y_col + key_ids]
+            vals += [rowsum, -np.ones(Y)]
+
+        if instance.GOAL == 1:
+
+            rows.append(coverage_row + np.arange(len(self.coverage_keys)))
+            cols.append(self.c_col + self.coverage_keys // K)
+            vals.append(-np.ones(len(self.coverage_keys)))
+
+        rhs += [0.0 if instance.GOAL == 1 else 1.0] * len(self.coverage_keys)
+        senses += "G" * len(self.coverage_keys)
+
+        if not lazy:
+
+            # linearization constraints for every detection key, the receivers come from the detection tensor
+            linearization_row = coverage_row + T * K
+
+            entries = (detection_prob.target.astype(np.int64) * K + detection_prob.theta) * S + detection_prob.source
+
+            rows += [linearization_row + key_ids, linearization_row + key_ids, linearization_row + entries]
+            cols += [self.y_col + key_ids, self.s_col + key_ids % S, self.r_col + detection_prob.receiver]
+            vals += [np.ones(Y), -rowsum, detection_prob.values()]
+
+            rhs += [0.0] * Y
+            senses += "G" * Y
+
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        vals = np.concatenate(vals)
+
+        # CSR format, ordered by row and column
+        order = np.lexsort((cols, rows))
+
+        self.indices = cols[order]
+        self.data = vals[order]
+        self.indptr = np.zeros(len(rhs) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(rhs)), out=self.indptr[1:])
+
+        self.rhs = np.array(rhs)
+        self.senses = senses
+
+        self.s = None
+        self.r = None
+        self.c = None
+        self.objective_value = None
+
+        end_time_model = time.time()
+
+        print(f"it took {(end_time_model - start_time_model):.2f} sec to build the matrix model with {len(self.rhs)} rows, {columns} columns and {len(self.data)} nonzeros")
+
+    def set_columns(self, instance, rowsum):
+
+        S = len(self.surface)
+        T = len(self.targets)
+        Y = len(rowsum)
+
+        # first column of every variable
+        self.s_col = 0
+        self.r_col = S
+        self.c_col = 2 * S
+        self.y_col = 2 * S + (T if instance.GOAL == 1 else 0)
+
+        columns = self.y_col + Y
+
+        # VARIABLES
+        self.obj = np.zeros(columns)
+        self.lb = np.zeros(columns)
+        self.ub = np.ones(columns)
+        self.ub[self.y_col:] = rowsum
+        self.types = "B" * self.y_col + "C" * Y
+
+        # OBJECTIVE
+        if instance.GOAL == 0:
+
+            # Minimize deployment cost
+            self.sense = "min"
+            self.obj[self.s_col:self.s_col + S] = instance.S
+            self.obj[self.r_col:self.r_col + S] = instance.R
+
+        else:
+
+            # Maximize coverage
+            self.sense = "max"
+            self.obj[self.c_col:self.c_col + T] = 100.0 / T
+
+    @classmethod
+    def from_blocks(cls, instance, ocean_surface, ocean, blocks):
+
+        """
+        Build the model (not lazy) from a stream of detection blocks.
+
+        The blocks have to cover the targets in order, as the ones of coverage_blocks. Every block
+        only adds its row sums and its linearization constraints, whose entries are written in
+        CSR order right away, so neither the detection tensor nor an unsorted triple list is kept.
+        The coefficients of s are only known after the last block if instance.BOUND == 1, so they
+        are filled in at the end. The coverage constraints follow the same pattern for every
+        (target, theta) and are built from the row sums at the end.
+
+        Parameters:
+        - instance (module): instance configuration
+        - ocean_surface (dictonary): 3D dictonary representing ocean surface
+        - ocean (dictonary): 3D dictonary representing ocean
+        - blocks (iterable): (first, last, target, theta, source, receiver) of consecutive blocks of targets
+
+        Returns:
+        - MatrixModel: the model, without detection_prob
+        """
+
+        start_time_model = time.time()
+
+        model = cls.__new__(cls)
+
+        model.surface = list(ocean_surface.keys())
+        model.targets = list(ocean.keys())
+        model.thetas = list(range(0, 180, instance.STEPS))
+        model.detection_prob = None
+        model.goal = instance.GOAL
+        model.lazy = False
+
+        S = len(model.surface)
+        T = len(model.targets)
+        K = len(model.thetas)
+        Y = T * K * S
+
+        # first column of every variable, as in set_columns
+        model.s_col = 0
+        model.r_col = S
+        model.y_col = 2 * S + (T if instance.GOAL == 1 else 0)
+
+        sums = RowSums(T, K, S)
+
+        # linearization constraints of every block in CSR order: s, the receivers and y of every detection key
+        indices = []
+        data = []
+        lengths = []
+
+        detections = 0
+        expected = 0
+
+        for first, last, target, theta, source, receiver in blocks:
+
+            if first != expected:
+                raise ValueError(f"expected the block of target {expected}, got target {first}")
+
+            expected = last
+
+            sums.add(first, last, target, theta, source, receiver)
+
+            keys = (last - first) * K * S
+            key = ((target.astype(np.int64) - first) * K + theta) * S + source
+
+            # the receivers of a key have to be ascending, as in the CSR format of the model
+            order = np.argsort(key * S + receiver, kind='stable')
+            key = key[order]
+            receiver = receiver[order]
+
+            count = np.bincount(key, minlength=keys)
+            start = np.concatenate(([0], np.cumsum(count + 2)[:-1]))
+
+            block_indices = np.empty(len(key) + 2 * keys, dtype=np.int64)
+            block_data = np.ones(len(key) + 2 * keys)
+
+            # every key before an entry adds its s and y entries
+            block_indices[start] = model.s_col + np.arange(keys) % S
+            block_indices[np.arange(len(key)) + 2 * key + 1] = model.r_col + receiver
+            block_indices[start + count + 1] = model.y_col + first * K * S + np.arange(keys)
+
+            indices.append(block_indices)
+            data.append(block_data)
+            lengths.append(count + 2)
+
+            detections += len(key)
+
+        if expected != T:
+            raise ValueError(f"expected blocks up to target {T}, got up to target {expected}")
+
+        rowsum = sums.bound_s(instance.BOUND).astype(float)
+
+        model.detection_keys = [tar + (theta,) + sur for tar in ocean for theta in model.thetas for sur in ocean_surface]
+
+        # VARIABLES and OBJECTIVE
+        model.set_columns(instance, rowsum)
+
+        # number of sources and receivers
+        row_indices = [model.s_col + np.arange(S), model.r_col + np.arange(S)]
+        row_data = [np.ones(S), np.ones(S)]
+        row_lengths = [np.array([S, S])]
+
+        if instance.GOAL == 0:
+            rhs = [1.0, 1.0]
+            senses = "GG"
+        else:
+            rhs = [float(instance.S), float(instance.R)]
+            senses = "EE"
+
+        # coverage constraints for every (target, theta): s, c (only for GOAL == 1) and y, ordered by column
+        model.coverage_keys = np.arange(T * K)
+
+        coverage_indices = [model.s_col + np.tile(np.arange(S), (T * K, 1))]
+        coverage_data = [rowsum.reshape(T * K, S)]
+
+        if instance.GOAL == 1:
+            coverage_indices.append(model.c_col + model.coverage_keys[:, None] // K)
+            coverage_data.append(-np.ones((T * K, 1)))
+
+        coverage_indices.append(model.y_col + np.arange(Y).reshape(T * K, S))
+        coverage_data.append(-np.ones((T * K, S)))
+
+        row_indices.append(np.hstack(coverage_indices).ravel())
+        row_data.append(np.hstack(coverage_data).ravel())
+        row_lengths.append(np.full(T * K, 2 * S + (1 if instance.GOAL == 1 else 0)))
+
+        rhs += [0.0 if instance.GOAL == 1 else 1.0] * (T * K)
+        senses += "G" * (T * K)
+
+        # linearization constraints, with the coefficients of s from the row sums
+        lengths = np.concatenate([np.zeros(0, dtype=np.int64)] + lengths)
+
+        linearization_data = np.concatenate([np.zeros(0)] + data)
+        linearization_data[np.cumsum(lengths) - lengths] = -rowsum
+
+        row_indices += indices
+        row_data.append(linearization_data)
+        row_lengths.append(lengths)
+
+        rhs += [0.0] * Y
+        senses += "G" * Y
+
+        model.indices = np.concatenate(row_indices)
+        model.data = np.concatenate(row_data)
+        model.indptr = np.zeros(len(rhs) + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(row_lengths), out=model.indptr[1:])
+
+        model.rhs = np.array(rhs)
+        model.senses = senses
+
+        model.s = None
+        model.r = None
+        model.c = None
+        model.objective_value = None
+
+        end_time_model = time.time()
+
+        print(f"it took {(end_time_model - start_time_model):.2f} sec to compute {detections} detection triples and build the matrix model with {len(model.rhs)} rows, {len(model.obj)} columns and {len(model.data)} nonzeros")
+
+        return model
+
+    def detection_tensor(self, ocean, ocean_surface):
+
+        """
+        Detection triples of the linearization constraints, for a model built with from_blocks.
+
+        Parameters:
+        - ocean (dictonary): 3D dictonary representing ocean
+        - ocean_surface (dictonary): 3D dictonary representing ocean surface
+
+        Returns:
+        - DetectionTensor: the detections of the model
+        """
+
+        S = len(self.surface)
+        K = len(self.thetas)
+
+        first_row = 2 + len(self.coverage_keys)
+
+        key = np.repeat(np.arange(len(self.detection_keys)), np.diff(self.indptr[first_row:]))
+
+        indices = self.indices[self.indptr[first_row]:]
+        data = self.data[self.indptr[first_row]:]
+
+        # the receiver entries, between the s and the y entry of every key
+        entry = (indices >= self.r_col) & (indices < self.r_col + S)
+
+        key = key[entry]
+        value = data[entry]
+
+        return DetectionTensor(ocean, ocean_surface, self.thetas, key // (K * S), key // S % K, key % S, indices[entry] - self.r_col, None if np.all(value == 1) else value)
+
+    def column_names(self):
+
+        # the names of the Pyomo model with symbolic labels
+        names = [f"s({x}_{y}_{z})" for x, y, z in self.surface]
+        names += [f"r({x}_{y}_{z})" for x, y, z in self.surface]
+
+        if self.goal == 1:
+            names += [f"c({x}_{y}_{z})" for x, y, z in self.targets]
+
+        names += ["y(" + "_".join(map(str, key)) + ")" for key in self.detection_keys]
+
+        return names
+
+    def row_names(self):
+
+        if self.goal == 0:
+            names = ["min_sources", "min_receivers"]
+        else:
+            names = ["fix_sources", "fix_receivers"]
+
+        K = len(self.thetas)
+
+        names += ["coverage_constraints({}_{}_{}_{})".format(*self.targets[key // K], self.thetas[key % K]) for key in self.coverage_keys.tolist()]
+        names += ["linearization(" + "_".join(map(str, key)) + ")" for key in self.detection_keys]
+
+        return names
+
+    def to_cplex(self):
+
+        """
+        Load the model into CPLEX with the bulk calls of the cplex Python API.
+
+        Returns:
+        - cplex.Cplex: the model
+        """
+
+        import cplex
+
+        cpx = cplex.Cplex()
+
+        if self.sense == "min":
+            cpx.objective.set_sense(cpx.objective.sense.minimize)
+        else:
+            cpx.objective.set_sense(cpx.objective.sense.maximize)
+
+        cpx.variables.add(obj=self.obj.tolist(), lb=self.lb.tolist(), ub=self.ub.tolist(), types=self.types, names=self.column_names())
+
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        data = self.data.tolist()
+
+        lin_expr = [cplex.SparsePair(ind=indices[first:last], val=data[first:last]) for first, last in zip(indptr[:-1], indptr[1:])]
+
+        cpx.linear_constraints.add(lin_expr=lin_expr, senses=self.senses, rhs=self.rhs.tolist(), names=self.row_names())
+
+        return cpx
+
+    def load_solution(self, x):
+
+        """
+        Store the solution values of s, r and c.
+
+        Parameters:
+        - x (list): value of every column
+        """
+
+        S = len(self.surface)
+
+        self.s = dict(zip(self.surface, x[self.s_col:self.s_col + S]))
+        self.r = dict(zip(self.surface, x[self.r_col:self.r_col + S]))
+
+        if self.goal == 1:
+            self.c = dict(zip(self.targets, x[self.c_col:self.c_col + len(self.targets)]))
+
+def solve_matrix_model(model, instance, outdir, mip_start=None):
+
+    """
+    Solve the matrix model with CPLEX and load the solution into the model.
+
+    Parameters:
+    - model (MatrixModel): the model
+    - instance (module): instance configuration
+    - outdir (str): directory of the LP files
+    - mip_start (tuple): (objective value, sources, receivers) of the greedy heuristic, or None
+    """
+
+    start_time = time.time()
+
+    cpx = model.to_cplex()
+
+    print(f"it took {(time.time() - start_time):.2f} sec to load the matrix model into CPLEX")
+
+    cpx.parameters.timelimit.set(instance.TIMELIMIT)
+    cpx.parameters.workmem.set(instance.RAM)
+    cpx.parameters.mip.tolerances.mipgap.set(0.0)
+
+    print(f"CPLEX timelimit set to: {cpx.parameters.timelimit.get()}")
+
+    if instance.HEURISTIC > 0:
+        print(f"The heuristic is only available for the pyomo model (BACKEND = 0), skipping it")
+
+    if mip_start is not None:
+
+        best_obj, best_sources, best_receivers = mip_start
+        print(f"Using solution with objective value {best_obj} as starting point")
+
+        S = len(model.surface)
+        deployed_s = np.array([loc in best_sources for loc in model.surface])
+        deployed_r = np.array([loc in best_receivers for loc in model.surface])
+
+        columns = list(range(model.s_col, model.s_col + S)) + list(range(model.r_col, model.r_col + S))
+        values = deployed_s.astype(float).tolist() + deployed_r.astype(float).tolist()
+
+        if model.goal == 1:
+
+            # targets which are detected at every angle by a deployed pair
+            detection_prob = model.detection_prob
+            detected = deployed_s[detection_prob.source] & deployed_r[detection_prob.receiver]
+            count = np.bincount(detection_prob.target[detected].astype(np.int64) * len(model.thetas) + detection_prob.theta[detected], minlength=len(model.targets) * len(model.thetas))
+
+            columns += list(range(model.c_col, model.c_col + len(model.targets)))
+            values += (count.reshape(len(model.targets), len(model.thetas)) > 0).all(axis=1).astype(float).tolist()
+
+        # without y the start is complete, otherwise CPLEX completes it by solving the remaining MIP
+        effort_level = cpx.MIP_starts.effort_level.repair if model.lazy else cpx.MIP_starts.effort_level.solve_MIP
+
+        cpx.MIP_starts.add([columns, values], effort_level, "greedy")
+
+    lazy_callback = None
+    usercut_callback = None
+
+    if model.lazy or instance.USERCUTS == 1:
+
+        from src.classes import CoverageSeparator, LazyCallback, UsercutCallback
+
+        separator = CoverageSeparator(model)
+
+    if model.lazy:
+
+        # the coverage is only added for the solutions which do not cover, this needs the original variables
+        cpx.parameters.preprocessing.reduce.set(1)
+        cpx.parameters.preprocessing.linear.set(0)
+
+        lazy_callback = cpx.register_callback(LazyCallback)
+        lazy_callback.separator = separator
+        lazy_callback.max_cuts = instance.MAXCUTS
+        lazy_callback.number_of_calls = 0
+        lazy_callback.number_of_cuts_added = 0
+        lazy_callback.time = 0.0
+
+        print(f"Coverage constraints are separated in a lazy constraint callback")
+
+    if instance.USERCUTS == 1:
+
+        cpx.parameters.preprocessing.linear.set(0)
+
+        usercut_callback = cpx.register_callback(UsercutCallback)
+        usercut_callback.separator = separator
+        usercut_callback.strength = instance.USERCUTSTRENGTH
+        usercut_callback.max_cuts = instance.MAXCUTS
+        usercut_callback.number_of_calls = 0
+        usercut_callback.number_of_cuts_added = 0
+        usercut_callback.time = 0.0
+
+    # Write the model before main solve
+    cpx.write(outdir + "/bison.lp")
+
+    if instance.SOLVE == 0:  # solve root relaxation
+
+        cpx.set_problem_type(cpx.problem_type.LP)
+        cpx.write(outdir + "/bison_relaxed.lp")
+
+        print("Solving root relaxation")
+
+    elif instance.SOLVE == 1:  # solve root + cuts
+
+        cpx.parameters.mip.limits.nodes.set(0)
+
+        print("Solving root node with cuts enabled")
+
+    else:  # full solve
+
+        print("Solving full model")
+
+    start_time = time.time()
+    cpx.solve()
+    solve_time = time.time() - start_time
+
+    print(f"Solver status: {cpx.solution.get_status_string()}")
+
+    for name, callback in (("lazy constraint", lazy_callback), ("user cut", usercut_callback)):
+        if callback is not None:
+            print(f"{name} callback: {callback.number_of_calls} calls, {callback.number_of_cuts_added} cuts added, {callback.time:.2f} sec")
+
+    if cpx.solution.is_primal_feasible():
+
+        model.load_solution(cpx.solution.get_values())
+        model.objective_value = cpx.solution.get_objective_value()
+
+        print(f"Final objective value: {model.objective_value}")
+
+    else:
+
+        model.load_solution([0.0] * cpx.variables.get_num())
+
+    print(f"Total solve time: {solve_time:.2f} seconds")
+
+def check_matrix_model(matrix_model, model):
+
+    """
+    Compare the matrix model with the Pyomo model of create_optimization_model.
+
+    Every constraint, the objective and the bounds and types of the variables are compared,
+    zero coefficients are ignored.
+
+    Parameters:
+    - matrix_model (MatrixModel): the matrix model
+    - model (ConcreteModel): the Pyomo model of the same instance
+
+    Returns:
+    - bool: True if both models are the same
+    """
+
+    from pyomo.environ import Binary, Constraint, Objective, value
+    from pyomo.repn import generate_standard_repn
+
+    # column of every Pyomo variable
+    column = {}
+
+    for i, loc in enumerate(matrix_model.surface):
+        column[id(model.s[loc])] = matrix_model.s_col + i
+        column[id(model.r[loc])] = matrix_model.r_col + i
+
+    if matrix_model.goal == 1:
+        for i, loc in enumerate(matrix_model.targets):
+            column[id(model.c[loc])] = matrix_model.c_col + i
+
+    for i, key in enumerate(matrix_model.detection_keys):
+        column[id(model.y[key])] = matrix_model.y_col + i
+
+    def terms(repn):
+        return {column[id(var)]: coef for var, coef in zip(repn.linear_vars, repn.linear_coefs) if coef != 0}
+
+    same = len(column) == len(matrix_model.obj)
+
+    # variables
+    for loc in matrix_model.surface:
+        same &= model.s[loc].domain is Binary and model.r[loc].domain is Binary
+
+    if matrix_model.goal == 1:
+        for loc in matrix_model.targets:
+            same &= model.c[loc].domain is Binary
+
+    for i, key in enumerate(matrix_model.detection_keys):
+        same &= model.y[key].lb == matrix_model.lb[matrix_model.y_col + i] and model.y[key].ub == matrix_model.ub[matrix_model.y_col + i]
+
+    # objective
+    objective = next(model.component_data_objects(Objective, active=True))
+    same &= terms(generate_standard_repn(objective.expr)) == {i: coef for i, coef in enumerate(matrix_model.obj.tolist()) if coef != 0}
+
+    # constraints in the order of the rows
+    constraints = [constraint for constraint in model.component_data_objects(Constraint, active=True, descend_into=True)]
+
+    same &= len(constraints) == len(matrix_model.rhs)
+
+    for i, constraint in enumerate(constraints):
+
+        if not same:
+            break
+
+        first, last = matrix_model.indptr[i], matrix_model.indptr[i + 1]
+
+        row = {int(j): coef for j, coef in zip(matrix_model.indices[first:last].tolist(), matrix_model.data[first:last].tolist()) if coef != 0}
+
+        repn = generate_standard_repn(constraint.body)
+
+        if matrix_model.senses[i] == "E":
+            bounds = (matrix_model.rhs[i], matrix_model.rhs[i])
+        else:
+            bounds = (matrix_model.rhs[i], None)
+
+        same &= terms(repn) == row and (value(constraint.lower) - repn.constant if constraint.has_lb() else None, value(constraint.upper) - repn.constant if constraint.has_ub() else None) == bounds
+
+    return bool(same)
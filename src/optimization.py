@@ -1,4 +1,9 @@
 from pyomo.environ import *
+import concurrent.futures
+import heapq
+import itertools
+import math
+import multiprocessing
 import time
 import random
 import os
@@ -79,26 +84,171 @@ def get_cplex_path():
     print(f"Defaulting to '{default_path}' (requires CPLEX in system PATH)")
     return default_path
 
-def create_solver(solver_name='cplex'):
+def create_solver(solver_name='cplex', persistent=False):
     """
     Create a solver instance with appropriate configuration.
     
     Args:
         solver_name (str): Name of the solver to use ('cplex' or 'gurobi')
+        persistent (bool): Create a persistent solver, which loads the model once with
+            set_instance and is then only updated
         
     Returns:
         SolverFactory: Configured solver instance
     """
     if solver_name.lower() == 'cplex':
-        cplex_path = get_cplex_path()
-        solver = SolverFactory('cplex_direct', executable=cplex_path)
+        if persistent:
+            solver = SolverFactory('cplex_persistent')
+        else:
+            cplex_path = get_cplex_path()
+            solver = SolverFactory('cplex_direct', executable=cplex_path)
     elif solver_name.lower() == 'gurobi':
-        solver = SolverFactory('gurobi')
+        solver = SolverFactory('gurobi_persistent' if persistent else 'gurobi')
     else:
         raise ValueError(f"Unsupported solver: {solver_name}")
     
     return solver
 
+def fix_variables(var, fixed, solver=None):
+    """
+    Fix the variables var to 1 at the locations in fixed and to 0 elsewhere.
+
+    Args:
+        var (Var): model.s or model.r
+        fixed (dict): locations to fix to 1
+        solver: persistent solver to update, or None
+    """
+    for loc in var:
+        var[loc].fix(1 if loc in fixed else 0)
+
+        if solver is not None:
+            solver.update_var(var[loc])
+
+def unfix_variables(var, solver=None):
+    """
+    Free the variables var.
+
+    Args:
+        var (Var): model.s or model.r
+        solver: persistent solver to update, or None
+    """
+    for loc in var:
+        var[loc].unfix()
+
+        if solver is not None:
+            solver.update_var(var[loc])
+
+def mip_start_values(model, instance, sources, receivers):
+    """
+    Set the variables of the model to the solution given by its sources and receivers.
+
+    y takes its smallest feasible value and c is 1 for the targets which are detected at every
+    angle, so the values are a complete solution which the solver only has to check.
+
+    Args:
+        model (ConcreteModel): the model
+        instance (module): instance configuration
+        sources (dict): locations of the sources
+        receivers (dict): locations of the receivers
+
+    Returns:
+        list: (variable, value) of all variables of the model
+    """
+    for loc in model.ocean_surface:
+        model.s[loc].set_value(1 if loc in sources else 0)
+        model.r[loc].set_value(1 if loc in receivers else 0)
+
+    for key in model.detection_keys:
+        model.y[key].set_value(0)
+
+    # the linearization constraints read y - rowsum * s + detecting receivers >= 0
+    for key in model.detection_keys:
+        model.y[key].set_value(max(0, -value(model.linearization[key].body)))
+
+    if instance.GOAL == 1:
+
+        for loc in model.ocean:
+            model.c[loc].set_value(0)
+
+        # the coverage constraints read rowsum * s - y - c >= 0
+        detected = {}
+
+        for tar_x, tar_y, tar_z, theta in model.coverage_constraints:
+            detected[tar_x, tar_y, tar_z] = detected.get((tar_x, tar_y, tar_z), True) and value(model.coverage_constraints[tar_x, tar_y, tar_z, theta].body) >= 1 - 1e-6
+
+        for loc in model.ocean:
+            model.c[loc].set_value(1 if detected.get(loc, False) else 0)
+
+    return [(var, value(var)) for var in model.component_data_objects(Var)]
+
+def cplex_columns(solver, variables):
+    """
+    CPLEX model and column names of Pyomo variables in a persistent CPLEX solver.
+
+    Pyomo has no public API for the solver variables of a persistent solver, so this reads the
+    private attributes _solver_model and _pyomo_var_to_solver_var_map of CPLEXPersistent (tested
+    with Pyomo 6.10.1). All such access is kept in this function.
+
+    Args:
+        solver: persistent CPLEX solver, which has loaded the model with set_instance
+        variables (list): Pyomo variables
+
+    Returns:
+        tuple: (cplex.Cplex, list of the column names of the variables)
+    """
+    if not solver.has_instance():
+        raise RuntimeError("the persistent solver has no model, call set_instance before adding MIP starts")
+
+    try:
+        return solver._solver_model, [solver._pyomo_var_to_solver_var_map[var] for var in variables]
+    except AttributeError as error:
+        raise RuntimeError(f"the CPLEX model of the persistent solver is not accessible in this Pyomo version (tested with 6.10.1): {error}")
+
+def add_mip_starts(model, instance, solver, solver_name, starts):
+    """
+    Pass solutions as MIP starts to a persistent CPLEX solver, which has loaded the model.
+
+    MIP starts are only passed to CPLEX, for other solvers they are skipped.
+
+    Args:
+        model (ConcreteModel): the model
+        instance (module): instance configuration
+        solver: persistent solver
+        solver_name (str): Name of the solver to use ('cplex' or 'gurobi')
+        starts (list): (objective value, sources, receivers) of the solutions
+    """
+    if solver_name.lower() != 'cplex':
+        print(f"MIP starts are only supported for CPLEX, skipping {len(starts)} MIP starts for {solver_name}")
+        return
+
+    start_time = time.time()
+
+    for number, (obj, sources, receivers) in enumerate(starts):
+
+        variables = mip_start_values(model, instance, sources, receivers)
+
+        cpx, columns = cplex_columns(solver, [var for var, _ in variables])
+        cpx.MIP_starts.add([columns, [val for _, val in variables]], cpx.MIP_starts.effort_level.repair, f"start{number}")
+
+    print(f"it took {(time.time() - start_time):.2f} sec to add {len(starts)} MIP starts")
+
+def group_detection_keys(detection_keys):
+    """
+    Group the detection keys by target and angle.
+
+    Args:
+        detection_keys (iterable): 7-tuples (tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z)
+
+    Returns:
+        dict: list of the detection keys in their original order, keyed by (tar_x, tar_y, tar_z, theta)
+    """
+    keys_by_target = {}
+
+    for key in detection_keys:
+        keys_by_target.setdefault(key[:4], []).append(key)
+
+    return keys_by_target
+
 def create_optimization_model(instance, ocean_surface, ocean, detection_prob_rowsum_s, detection_prob):
     # Create concrete model
     model = ConcreteModel()
@@ -177,9 +327,13 @@ def create_optimization_model(instance, ocean_surface, ocean, detection_prob_row
         model.fix_receivers = Constraint(rule=fix_receivers_rule)
     
     # Coverage constraints
+    start_time_coverage = time.time()
+
+    # group the detection keys by target and angle in a single pass
+    keys_by_target = group_detection_keys(detection_prob_rowsum_s)
+
     def coverage_rule(model, tar_x, tar_y, tar_z, theta):
-        relevant_keys = [k for k in model.detection_keys 
-                        if k[0] == tar_x and k[1] == tar_y and k[2] == tar_z and k[3] == theta]
+        relevant_keys = keys_by_target.get((tar_x, tar_y, tar_z, theta), [])
         
         expr = sum(detection_prob_rowsum_s[k] * model.s[(k[4], k[5], k[6])] -
                   model.y[k] for k in relevant_keys)
@@ -195,8 +349,12 @@ def create_optimization_model(instance, ocean_surface, ocean, detection_prob_row
         ((x, y, z, theta) for x, y, z in model.ocean for theta in model.theta_range),
         rule=coverage_rule
     )
+
+    print(f"it took {(time.time() - start_time_coverage):.2f} sec to build {len(model.coverage_constraints)} coverage constraints")
     
     # Linearization constraints
+    start_time_linearization = time.time()
+
     def linearization_rule(model, *keys):
 
         tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z = keys
@@ -204,276 +362,438 @@ def create_optimization_model(instance, ocean_surface, ocean, detection_prob_row
         
         expr = (model.y[keys] - detection_prob_rowsum_s[keys] * model.s[source_loc])
         
-        # Add receiver terms if they exist in detection_prob
-        for rx_x, rx_y, rx_z in model.ocean_surface:
-
-            full_key = (tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z)
+        # Add the receiver terms of the (target, theta, source) row from the adjacency index
+        first, last = detection_prob.row(detection_prob.target_index[tar_x, tar_y, tar_z], detection_prob.theta_index[theta], detection_prob.surface_index[source_loc])
 
-            if full_key in detection_prob:
-                expr += detection_prob[full_key] * model.r[(rx_x, rx_y, rx_z)]
+        for n, rx in enumerate(detection_prob.receiver[first:last].tolist(), first):
+            expr += (1 if detection_prob.value is None else detection_prob.value[n].item()) * model.r[detection_prob.surface[rx]]
         
         return expr >= 0
     
     model.linearization = Constraint(model.detection_keys, rule=linearization_rule)
+
+    print(f"it took {(time.time() - start_time_linearization):.2f} sec to build {len(model.linearization)} linearization constraints")
     
     return model
 
-def apply_heuristic(model, instance, ocean_surface, solver_name='cplex'):
+def create_heuristic_solver(instance, solver_name='cplex'):
+    """
+    Create the persistent solver of the heuristic.
 
-    print(f"Running {instance.HEURISTIC} rounds of heuristic")
+    The rounds are solved single-threaded and without reusing the solution of the previous solve
+    as start, so a round gives the same result in every worker of the heuristic.
 
-    solver_heu = create_solver(solver_name)
+    Args:
+        instance (module): instance configuration
+        solver_name (str): Name of the solver to use ('cplex' or 'gurobi')
+
+    Returns:
+        SolverFactory: persistent solver
+    """
+    solver_heu = create_solver(solver_name, persistent=True)
 
     # Create solver interface
     if solver_name == 'cplex':
         solver_heu.options['timelimit'] = instance.TIMELIMIT_HEURISTIC
         solver_heu.options['workmem'] = instance.RAM
         solver_heu.options['mipgap'] = 0.0
+        solver_heu.options['threads'] = 1
+        solver_heu.options['advance'] = 0
     elif solver_name == 'gurobi':    
         solver_heu.options['TimeLimit'] = instance.TIMELIMIT_HEURISTIC
         solver_heu.options['NodefileStart'] = instance.RAM / 1024
         solver_heu.options['MIPGap'] = 0.0
-    
-    print(f"CPLEX timelimit set to: {solver_heu.options['timelimit']}")
-    
-    if instance.GOAL == 0:  # minimize cost for deployed equipment
+        solver_heu.options['Threads'] = 1
 
-        print(f"Running heuristic for cost minimization = 0")
+    return solver_heu
 
-        best_obj = float('inf')
-        best_sources = {}
-        best_receivers = {}
-        
-        # PREQUEL
-        fixed_receivers = dict(ocean_surface)  # Start with all positions
-        old_obj = float('inf')
+def set_source_count(model, solver, number_of_sources):
+    """
+    Replace the constraint on the number of sources of the heuristic for cost minimization.
+
+    Args:
+        model (ConcreteModel): the model
+        solver: persistent solver to update
+        number_of_sources (int): number of sources
+    """
+    if hasattr(model, 'source_count_constraint'):
+        solver.remove_constraint(model.source_count_constraint)
+    model.del_component('source_count_constraint')
+    model.source_count_constraint = Constraint(
+        expr = sum(model.s[tx_x, tx_y, tx_z] for tx_x, tx_y, tx_z in model.ocean_surface) == number_of_sources
+    )
+    solver.add_constraint(model.source_count_constraint)
+
+def source_weights(model):
+    """
+    Weight of every source location for the random source sets of the heuristic: the number of
+    (target, angle) which the source detects with any receiver.
+
+    Args:
+        model (ConcreteModel): the model
+
+    Returns:
+        dict: weight of every location of the ocean surface
+    """
+    weights = dict.fromkeys(model.ocean_surface, 0)
+
+    for key in model.detection_keys:
+        weights[key[4:]] += 1
+
+    return weights
+
+def sample_source_sets(rng, ocean_surface, number_of_sources, rounds, weights=None):
+    """
+    Draw the random source sets of the heuristic rounds, every set is drawn only once.
+
+    The sets are drawn without replacement and told apart by the bitmask of their locations.
+    If there are not more than twice as many sets as rounds, the rounds are drawn from all sets,
+    so the sampling cannot run out of new sets.
+
+    Args:
+        rng (random.Random): random number generator
+        ocean_surface (dict): 3D dictonary representing ocean surface
+        number_of_sources (int): number of sources in each set
+        rounds (int): number of sets
+        weights (dict): weight of every location to draw locations with a large weight more
+            often, or None to draw uniformly
+
+    Returns:
+        list: dicts of the source locations, one per round, fewer if there are less sets
+    """
+    ocean_surface_list = list(ocean_surface.keys())
+    n = len(ocean_surface_list)
+
+    total = math.comb(n, number_of_sources)
+
+    if total < rounds:
+        print(f"There are only {total} different sets of {number_of_sources} sources, running {total} rounds of heuristic")
+        rounds = total
+
+    if total <= 2 * rounds:
+
+        # few sets, draw the rounds from all of them
+        subsets = rng.sample(list(itertools.combinations(range(n), number_of_sources)), rounds)
+
+    else:
+
+        if weights is not None:
+            # weighted sampling without replacement with keys u^(1/w), every location keeps a small weight
+            largest = max(weights.values())
+            w = [max(weights[loc], 0.01 * largest, 1e-9) for loc in ocean_surface_list]
+
+        subsets = []
+        seen = set()
+
+        while len(subsets) < rounds:
+
+            if weights is None:
+                subset = rng.sample(range(n), number_of_sources)
+            else:
+                keys = [rng.random() ** (1.0 / w_i) for w_i in w]
+                subset = heapq.nlargest(number_of_sources, range(n), key=keys.__getitem__)
+
+            mask = sum(1 << i for i in subset)
+
+            if mask not in seen:
+                seen.add(mask)
+                subsets.append(sorted(subset))
+
+    return [{ocean_surface_list[i]: 1 for i in subset} for subset in subsets]
+
+def heuristic_round_cost(model, solver, fixed_sources, tee=True):
+    """
+    One round of the heuristic for cost minimization: fix the sources and solve for the receivers.
+
+    Returns:
+        tuple: (objective value, receivers), objective value None if infeasible
+    """
+    # Fix sources and free receivers
+    fix_variables(model.s, fixed_sources, solver)
+    unfix_variables(model.r, solver)
         
-        while True:
-            # Fix receivers and free sources
-            for rx_x, rx_y, rx_z in model.ocean_surface:
+    results = solver.solve(tee=tee)
 
-                if (rx_x, rx_y, rx_z) in fixed_receivers:
-                    model.r[rx_x, rx_y, rx_z].fix(1)
-                else:
-                    model.r[rx_x, rx_y, rx_z].fix(0)
-                    
-            for tx_x, tx_y, tx_z in model.ocean_surface:
-                model.s[tx_x, tx_y, tx_z].unfix()
-            
-            # Solve for sources
-            print("Solving for sources")
-            results = solver_heu.solve(model, tee=True)
-            print(f"Solver status: {results.solver.status}")
-            if results.solver.status == SolverStatus.ok:
+    if results.solver.termination_condition != TerminationCondition.infeasible:
+        obj = value(model.objective)
+        fixed_receivers = {(rx_x, rx_y, rx_z): 1 for rx_x, rx_y, rx_z in model.ocean_surface if value(model.r[rx_x, rx_y, rx_z]) > 0.999}
 
-                obj = value(model.objective)
-                fixed_sources = {(tx_x, tx_y, tx_z): 1 for tx_x, tx_y, tx_z in model.ocean_surface if value(model.s[tx_x, tx_y, tx_z]) > 0.999}
-                
-                # Fix sources and free receivers
-                for tx_x, tx_y, tx_z in model.ocean_surface:
-                    if (tx_x, tx_y, tx_z) in fixed_sources:
-                        model.s[tx_x, tx_y, tx_z].fix(1)
-                    else:
-                        model.s[tx_x, tx_y, tx_z].fix(0)
-                        
-                for rx_x, rx_y, rx_z in model.ocean_surface:
-                    model.r[rx_x, rx_y, rx_z].unfix()
-                
-                # Solve for receivers
-                print("Solving for receivers")
-                results = solver_heu.solve(model, tee=True)
-                
-                if results.solver.status == SolverStatus.ok:
-                    obj = value(model.objective)
-                    fixed_receivers = {(rx_x, rx_y, rx_z): 1 for rx_x, rx_y, rx_z in model.ocean_surface if value(model.r[rx_x, rx_y, rx_z]) > 0.999}
-                    
-                    if old_obj > obj:
-                        old_obj = obj
-                    else:
-                        break
-            
-            best_receivers = fixed_receivers
-            best_sources = fixed_sources
-            best_obj = obj
-            
-            number_of_sources = len(fixed_sources)
-            number_of_receivers = len(fixed_receivers)
+        return obj, fixed_receivers
+
+    return None, None
+
+def heuristic_round_coverage(model, solver, fixed_sources):
+    """
+    One round of the heuristic for coverage maximization: starting from the fixed sources,
+    alternately solve for the receivers and the sources until the coverage does not improve.
+
+    Returns:
+        tuple: (objective value, sources, receivers)
+    """
+    print(f"Fixing sources at: {fixed_sources}")
+    old_obj = -1
+    
+    while True:
+
+        # Fix sources and free receivers
+        fix_variables(model.s, fixed_sources, solver)
+        unfix_variables(model.r, solver)
+
+        results = solver.solve(tee=False)
+
+        if results.solver.status == SolverStatus.ok:
+
+            obj = value(model.objective)
+            print(f"Solution value (ocean coverage percentage) = {obj}")
             
-            print(f"  Found new incumbent at iteration 0 with objective value {obj}")
+            fixed_receivers = {(rx_x, rx_y, rx_z): 1 
+            for rx_x, rx_y, rx_z in model.ocean_surface 
+                if value(model.r[rx_x, rx_y, rx_z]) > 0.999}
             
-            # Add constraint for number of sources
-            model.del_component('source_count_constraint')
-            model.source_count_constraint = Constraint(
-                expr = sum(model.s[tx_x, tx_y, tx_z] for tx_x, tx_y, tx_z in model.ocean_surface) == number_of_sources
-            )
+            # Fix receivers and free sources
+            fix_variables(model.r, fixed_receivers, solver)
+            unfix_variables(model.s, solver)
             
-            # LOOP HEURISTIC
-            list_of_fixed_sources = []
+            results = solver.solve(tee=False)
             
-            for round in range(1, instance.HEURISTIC + 1, 1):
-                print(f"----------{round}-----------")
+            if results.solver.status == SolverStatus.ok:
+
+                obj = value(model.objective)
+                print(f"Solution value (ocean coverage percentage) = {obj}")
                 
-                while True:
+                fixed_sources = {(tx_x, tx_y, tx_z): 1 
+                for tx_x, tx_y, tx_z in model.ocean_surface 
+                    if value(model.s[tx_x, tx_y, tx_z]) > 0.999}
+                
+                if old_obj < obj:
+                    old_obj = obj
+                else:
+                    break
 
-                    fixed_sources = {}
-                    ocean_surface_list = list(ocean_surface.keys())
+    return obj, fixed_sources, fixed_receivers
 
-                    while len(fixed_sources) < number_of_sources:
+# model and persistent solver of a worker process of the heuristic
+heuristic_worker = {}
 
-                        tx_x, tx_y, tx_z = random.choice(ocean_surface_list)
+def init_heuristic_worker(model, instance, solver_name):
 
-                        if (tx_x, tx_y, tx_z) not in fixed_sources:
+    # the model is inherited from the main process by fork, only the solver is new
+    heuristic_worker['model'] = model
+    heuristic_worker['solver'] = create_heuristic_solver(instance, solver_name)
+    heuristic_worker['solver'].set_instance(model)
+    heuristic_worker['number_of_sources'] = None
 
-                            fixed_sources[tx_x, tx_y, tx_z] = 1
+def run_heuristic_round(task):
 
-                    if fixed_sources not in list_of_fixed_sources:
+    round, fixed_sources, number_of_sources = task
 
-                        list_of_fixed_sources.append(fixed_sources)
-                        break
+    model = heuristic_worker['model']
+    solver = heuristic_worker['solver']
 
-                # Fix sources and free receivers
-                for tx_x, tx_y, tx_z in model.ocean_surface:
+    start_time_round = time.time()
 
-                    if (tx_x, tx_y, tx_z) in fixed_sources:
-                        model.s[tx_x, tx_y, tx_z].fix(1)
-                    else:
-                        model.s[tx_x, tx_y, tx_z].fix(0)
+    if number_of_sources is None:
 
-                for rx_x, rx_y, rx_z in model.ocean_surface:
-                    model.r[rx_x, rx_y, rx_z].unfix()
-                    
-                results = solver_heu.solve(model, tee=True)
+        result = heuristic_round_coverage(model, solver, fixed_sources)
 
-                if results.solver.termination_condition != TerminationCondition.infeasible:
-                    obj = value(model.objective)
-                    fixed_receivers = {(rx_x, rx_y, rx_z): 1 for rx_x, rx_y, rx_z in model.ocean_surface if value(model.r[rx_x, rx_y, rx_z]) > 0.999}
+    else:
 
-                    if best_obj > obj:
+        if heuristic_worker['number_of_sources'] != number_of_sources:
+            set_source_count(model, solver, number_of_sources)
+            heuristic_worker['number_of_sources'] = number_of_sources
 
-                        best_obj = obj
-                        best_receivers = fixed_receivers
-                        best_sources = fixed_sources
-                        print(f"  Found new incumbent at iteration {round} with objective value {obj}")
+        result = heuristic_round_cost(model, solver, fixed_sources, tee=False)
+
+    return round, result, time.time() - start_time_round
+
+def apply_heuristic(model, instance, ocean_surface, solver_name='cplex'):
+
+    print(f"Running {instance.HEURISTIC} rounds of heuristic")
+
+    # the random source sets are drawn in the main process, so the rounds do not depend on the number of workers
+    rng = random.Random(instance.SEED)
+
+    # locations which detect more are drawn more often as sources
+    weights = source_weights(model) if instance.HEURISTIC_SAMPLING == 1 else None
+
+    workers = instance.HEURISTIC_WORKERS
+
+    if workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+
+        print(f"Parallel heuristic needs the fork start method, running the rounds serially")
+        workers = 1
+
+    start_time_heuristic = time.time()
+
+    executor = None
+
+    if workers > 1:
+
+        # the workers are forked before the main process loads CPLEX and share the model copy-on-write
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'), initializer=init_heuristic_worker, initargs=(model, instance, solver_name))
+        executor.submit(time.time).result()
+
+        print(f"Running the rounds of the heuristic in {workers} processes")
+
+    # the model is loaded into the persistent solver once, between the solves only the bounds of s and r are updated
+    solver_heu = create_heuristic_solver(instance, solver_name)
     
-    else:  # GOAL = 1 (maximize coverage)
+    print(f"CPLEX timelimit set to: {solver_heu.options['timelimit']}")
 
-        print(f"Running heuristic for coverage maximization = 1")
+    solver_heu.set_instance(model)
 
-        best_obj = -1
-        best_sources = []
-        best_receivers = []
-        list_of_fixed_sources = []
-        
-        for round in range(1, instance.HEURISTIC + 1, 1):
-            print(f"----------{round}-----------")
-            
-            while True:
-                fixed_sources = {}
-                ocean_surface_list = list(ocean_surface.keys())
+    print(f"it took {(time.time() - start_time_heuristic):.2f} sec to load the model into the persistent solver")
 
-                while len(fixed_sources) < instance.S:
+    def run_rounds(tasks):
 
-                    tx_x, tx_y, tx_z = random.choice(ocean_surface_list)
+        # results of the rounds in the order of the rounds
+        if executor is not None:
+            yield from executor.map(run_heuristic_round, tasks)
+            return
 
-                    if (tx_x, tx_y, tx_z) not in fixed_sources:
-                        fixed_sources[tx_x, tx_y, tx_z] = 1
+        for round, fixed_sources, number_of_sources in tasks:
 
-                if fixed_sources not in list_of_fixed_sources:
+            start_time_round = time.time()
 
-                    list_of_fixed_sources.append(fixed_sources)
-                    break
-            
-            print(f"Fixing sources at: {fixed_sources}")
-            old_obj = -1
-            
-            while True:
+            print(f"----------{round}-----------")
 
-                # Fix sources and free receivers
-                for tx_x, tx_y, tx_z in model.ocean_surface:
+            if number_of_sources is None:
+                result = heuristic_round_coverage(model, solver_heu, fixed_sources)
+            else:
+                result = heuristic_round_cost(model, solver_heu, fixed_sources)
 
-                    if (tx_x, tx_y, tx_z) in fixed_sources:
-                        model.s[tx_x, tx_y, tx_z].fix(1)
-                    else:
-                        model.s[tx_x, tx_y, tx_z].fix(0)
+            yield round, result, time.time() - start_time_round
+    
+    try:
 
-                for rx_x, rx_y, rx_z in model.ocean_surface:
-                    model.r[rx_x, rx_y, rx_z].unfix()
+        if instance.GOAL == 0:  # minimize cost for deployed equipment
 
-                results = solver_heu.solve(model, tee=False)
+            print(f"Running heuristic for cost minimization = 0")
 
+            best_obj = float('inf')
+            best_sources = {}
+            best_receivers = {}
+            incumbents = []
+            
+            # PREQUEL
+            fixed_receivers = dict(ocean_surface)  # Start with all positions
+            old_obj = float('inf')
+            
+            while True:
+                # Fix receivers and free sources
+                fix_variables(model.r, fixed_receivers, solver_heu)
+                unfix_variables(model.s, solver_heu)
+                
+                # Solve for sources
+                print("Solving for sources")
+                results = solver_heu.solve(tee=True)
+                print(f"Solver status: {results.solver.status}")
                 if results.solver.status == SolverStatus.ok:
 
                     obj = value(model.objective)
-                    print(f"Solution value (ocean coverage percentage) = {obj}")
+                    fixed_sources = {(tx_x, tx_y, tx_z): 1 for tx_x, tx_y, tx_z in model.ocean_surface if value(model.s[tx_x, tx_y, tx_z]) > 0.999}
                     
-                    fixed_receivers = {(rx_x, rx_y, rx_z): 1 
-                    for rx_x, rx_y, rx_z in model.ocean_surface 
-                        if value(model.r[rx_x, rx_y, rx_z]) > 0.999}
+                    # Fix sources and free receivers
+                    fix_variables(model.s, fixed_sources, solver_heu)
+                    unfix_variables(model.r, solver_heu)
                     
-                    # Fix receivers and free sources
-                    for rx_x, rx_y, rx_z in model.ocean_surface:
-
-                        if (rx_x, rx_y, rx_z) in fixed_receivers:
-                            model.r[rx_x, rx_y, rx_z].fix(1)
-                        else:
-                            model.r[rx_x, rx_y, rx_z].fix(0)
-                            
-                    for tx_x, tx_y, tx_z in model.ocean_surface:
-                        model.s[tx_x, tx_y, tx_z].unfix()
-                    
-                    results = solver_heu.solve(model, tee=False)
+                    # Solve for receivers
+                    print("Solving for receivers")
+                    results = solver_heu.solve(tee=True)
                     
                     if results.solver.status == SolverStatus.ok:
-
                         obj = value(model.objective)
-                        print(f"Solution value (ocean coverage percentage) = {obj}")
+                        fixed_receivers = {(rx_x, rx_y, rx_z): 1 for rx_x, rx_y, rx_z in model.ocean_surface if value(model.r[rx_x, rx_y, rx_z]) > 0.999}
                         
-                        fixed_sources = {(tx_x, tx_y, tx_z): 1 
-                        for tx_x, tx_y, tx_z in model.ocean_surface 
-                            if value(model.s[tx_x, tx_y, tx_z]) > 0.999}
-                        
-                        if old_obj < obj:
+                        if old_obj > obj:
                             old_obj = obj
                         else:
                             break
-            
-            if best_obj < obj:
-                best_obj = obj
+                
                 best_receivers = fixed_receivers
                 best_sources = fixed_sources
-                print(f"  Found new incumbent at iteration {round} with objective value {obj}")
-    
-    # Set model to best solution found
-    for rx_x, rx_y, rx_z in model.ocean_surface:
+                best_obj = obj
+                incumbents.append((best_obj, best_sources, best_receivers))
+                
+                number_of_sources = len(fixed_sources)
+                number_of_receivers = len(fixed_receivers)
+                
+                print(f"  Found new incumbent at iteration 0 with objective value {obj}")
+                
+                # Add constraint for number of sources
+                set_source_count(model, solver_heu, number_of_sources)
+                
+                # LOOP HEURISTIC
+                list_of_fixed_sources = sample_source_sets(rng, ocean_surface, number_of_sources, instance.HEURISTIC, weights)
 
-        if (rx_x, rx_y, rx_z) in best_receivers:
-            model.r[rx_x, rx_y, rx_z].fix(1)
-        else:
-            model.r[rx_x, rx_y, rx_z].fix(0)
+                tasks = [(round, fixed_sources, number_of_sources) for round, fixed_sources in enumerate(list_of_fixed_sources, 1)]
+
+                for round, (obj, fixed_receivers), round_time in run_rounds(tasks):
+
+                    if obj is not None and best_obj > obj:
+
+                        best_obj = obj
+                        best_receivers = fixed_receivers
+                        best_sources = list_of_fixed_sources[round - 1]
+                        incumbents.append((best_obj, best_sources, best_receivers))
+                        print(f"  Found new incumbent at iteration {round} with objective value {obj}")
+
+                    print(f"it took {round_time:.2f} sec for round {round} of the heuristic")
+        
+        else:  # GOAL = 1 (maximize coverage)
+
+            print(f"Running heuristic for coverage maximization = 1")
+
+            best_obj = -1
+            best_sources = []
+            best_receivers = []
+            incumbents = []
+
+            list_of_fixed_sources = sample_source_sets(rng, ocean_surface, instance.S, instance.HEURISTIC, weights)
+
+            tasks = [(round, fixed_sources, None) for round, fixed_sources in enumerate(list_of_fixed_sources, 1)]
             
-    for tx_x, tx_y, tx_z in model.ocean_surface:
+            for round, (obj, fixed_sources, fixed_receivers), round_time in run_rounds(tasks):
+                
+                if best_obj < obj:
+                    best_obj = obj
+                    best_receivers = fixed_receivers
+                    best_sources = fixed_sources
+                    incumbents.append((best_obj, best_sources, best_receivers))
+                    print(f"  Found new incumbent at iteration {round} with objective value {obj}")
 
-        if (tx_x, tx_y, tx_z) in best_sources:
-            model.s[tx_x, tx_y, tx_z].fix(1)
-        else:
-            model.s[tx_x, tx_y, tx_z].fix(0)
+                print(f"it took {round_time:.2f} sec for round {round} of the heuristic")
+
+    finally:
+
+        if executor is not None:
+            executor.shutdown()
+    
+    # Set model to best solution found
+    fix_variables(model.r, best_receivers, solver_heu)
+    fix_variables(model.s, best_sources, solver_heu)
     
     # Solve one more time with fixed values
     print("Solving last heuristic solution to check feasibility")
-    results = solver_heu.solve(model, tee=False)
+    results = solver_heu.solve(tee=False)
     
     # Unfix all variables for the main solve
-    for tx_x, tx_y, tx_z in model.ocean_surface:
-        model.s[tx_x, tx_y, tx_z].unfix()
-    for rx_x, rx_y, rx_z in model.ocean_surface:
-        model.r[rx_x, rx_y, rx_z].unfix()
+    unfix_variables(model.s)
+    unfix_variables(model.r)
+
+    # the number of sources is only fixed for the rounds of the heuristic
+    model.del_component('source_count_constraint')
+
+    print(f"it took {(time.time() - start_time_heuristic):.2f} sec to run the heuristic")
     
-    return best_obj, best_sources, best_receivers
+    # all incumbents are passed to the main solve as MIP starts, the best is the last
+    return incumbents
 
-def solve_model(model, instance, ocean_surface, outdir, solver_name='cplex'):
+def solve_model(model, instance, ocean_surface, outdir, solver_name='cplex', mip_start=None):
     
-    # Create solver instance with flexible path resolution
-    solver = create_solver(solver_name)
+    # Create solver instance with flexible path resolution, the model is loaded once and the
+    # heuristic solutions are added as MIP starts
+    solver = create_solver(solver_name, persistent=True)
     
     # Set solver options
     if solver_name.lower() == 'cplex':
@@ -491,41 +811,30 @@ def solve_model(model, instance, ocean_surface, outdir, solver_name='cplex'):
 
     print(f"CPLEX timelimit set to: {solver.options['timelimit']}")
 
+    if instance.LAZY == 1 or instance.USERCUTS == 1:
+        print(f"Lazy constraints and user cuts are only available for the matrix model (BACKEND = 1), skipping them")
+
+    # starting points as (objective value, sources, receivers), mip_start is the greedy heuristic or None
+    starts = [mip_start] if mip_start is not None else []
+
     # Apply heuristic if requested
     if instance.HEURISTIC > 0:
 
-        best_obj, best_sources, best_receivers = apply_heuristic(model, instance, ocean_surface, solver_name)
-        print(f"Heuristic found solution with objective value: {best_obj}")
+        incumbents = apply_heuristic(model, instance, ocean_surface, solver_name)
 
-        print(f"After unfixing, CPLEX timelimit set to: {solver.options['timelimit']}")
+        if incumbents:
+            print(f"Heuristic found solution with objective value: {incumbents[-1][0]}")
 
-        # Use heuristic solution to warm start the main solve
-        # First fix the best solution found
-        for tx_x, tx_y, tx_z in model.ocean_surface:
+        starts += incumbents
 
-            if (tx_x, tx_y, tx_z) in best_sources:
-                model.s[tx_x, tx_y, tx_z].fix(1)
-            else:
-                model.s[tx_x, tx_y, tx_z].fix(0)
-                
-        for rx_x, rx_y, rx_z in model.ocean_surface:
+    if starts:
 
-            if (rx_x, rx_y, rx_z) in best_receivers:
-                model.r[rx_x, rx_y, rx_z].fix(1)
-            else:
-                model.r[rx_x, rx_y, rx_z].fix(0)
-        
-        # Solve once with fixed values to get a valid starting point
-        print("Solving with heuristic solution as starting point")
-        results = solver.solve(model, tee=True)
-        
-        # Unfix all variables for the main solve
-        for tx_x, tx_y, tx_z in model.ocean_surface:
-            model.s[tx_x, tx_y, tx_z].unfix()
-        for rx_x, rx_y, rx_z in model.ocean_surface:
-            model.r[rx_x, rx_y, rx_z].unfix()
+        # the best starting point first
+        starts = sorted(starts, key=lambda start: start[0], reverse=instance.GOAL == 1)
+        best_obj = starts[0][0]
+
+        print(f"Using {len(starts)} solutions with best objective value {best_obj} as starting points")
 
-    print(f"After unfixing, CPLEX timelimit set to: {solver.options['timelimit']}")
     # Write the model before main solve
     model.write(outdir + "/bison.lp", io_options={'symbolic_solver_labels': True})
 
@@ -540,13 +849,21 @@ def solve_model(model, instance, ocean_surface, outdir, solver_name='cplex'):
         # Write relaxed model
         model.write(outdir + "/bison_relaxed.lp", io_options={'symbolic_solver_labels': True})
 
+    start_time = time.time()
+
+    solver.set_instance(model)
+
+    print(f"it took {(time.time() - start_time):.2f} sec to load the model into the solver")
+
+    if starts and instance.SOLVE > 0:
+        add_mip_starts(model, instance, solver, solver_name, starts)
+
+    if instance.SOLVE == 0:  # solve root relaxation
+
         print("Solving root relaxation")
 
         start_time = time.time()
-        if instance.HEURISTIC > 0:
-            results = solver.solve(model, warmstart=True, tee=True, load_solutions=True)
-        else:   
-            results = solver.solve(model, tee=True)
+        results = solver.solve(tee=True)
         solve_time = time.time() - start_time
 
         print(f"Root relaxation objective value: {value(model.objective)}")
@@ -561,10 +878,7 @@ def solve_model(model, instance, ocean_surface, outdir, solver_name='cplex'):
         print("Solving root node with cuts enabled")
 
         start_time = time.time()
-        if instance.HEURISTIC > 0:
-            results = solver.solve(model, warmstart=True, tee=True, load_solutions=True)
-        else:
-            results = solver.solve(model, tee=True)
+        results = solver.solve(tee=True)
         solve_time = time.time() - start_time
 
         print(f"Root + cuts objective value: {value(model.objective)}")
@@ -574,10 +888,7 @@ def solve_model(model, instance, ocean_surface, outdir, solver_name='cplex'):
         print("Solving full model")
 
         start_time = time.time()
-        if instance.HEURISTIC > 0:
-            results = solver.solve(model, warmstart=True, tee=True, load_solutions=True)
-        else:
-            results = solver.solve(model, tee=True)
+        results = solver.solve(tee=True)
         solve_time = time.time() - start_time
         
         if (results.solver.status == SolverStatus.ok and results.solver.termination_condition == TerminationCondition.optimal):
@@ -592,7 +903,7 @@ def solve_model(model, instance, ocean_surface, outdir, solver_name='cplex'):
         print(f"Final objective value: {final_obj}")
         
         # Compare with heuristic if it was used
-        if instance.HEURISTIC > 0:
+        if starts:
             if instance.GOAL == 0:  # minimization
                 improvement = ((best_obj - final_obj) / best_obj * 100)
                 if improvement > 0:
@@ -87,7 +87,7 @@ def create_plot_func_g(instance, outdir):
         # Angle in degree
         tt = t*180/pi
 
-        s = g_cos(t, instance)
+        s = TargetStrength(instance.TS)(np.cos(t))
 
         fig, ax = plt.subplots()
         ax.plot(tt, s)
@@ -118,7 +118,7 @@ def output_solution(model, instance, ocean_surface, ocean, detection_prob, map,
         instance: Problem instance
         ocean_surface: Dictionary of surface coordinates
         ocean: Dictionary of ocean points
-        detection_prob: Dictionary of detection probabilities
+        detection_prob: DetectionTensor of detection probabilities
         map: Dictionary or 2D array with depth values
         min_depth: Minimum depth value
         max_depth: Maximum depth value
@@ -167,12 +167,14 @@ def output_solution(model, instance, ocean_surface, ocean, detection_prob, map,
     # ---------------------------------------------------
     # --- compute coverage value per pixel
     # ---------------------------------------------------
-    cov_val = {(tar_x, tar_y, tar_z): 0 for tar_x, tar_y, tar_z in ocean}
+    deployed_s = np.array([value(model.s[tx_x, tx_y, tx_z]) > 0.999 for tx_x, tx_y, tx_z in ocean_surface])
+    deployed_r = np.array([value(model.r[rx_x, rx_y, rx_z]) > 0.999 for rx_x, rx_y, rx_z in ocean_surface])
 
-    for tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z in detection_prob:
-        if (value(model.s[tx_x, tx_y, tx_z]) > 0.999 and 
-            value(model.r[rx_x, rx_y, rx_z]) > 0.999):
-            cov_val[tar_x, tar_y, tar_z] += detection_prob[tar_x, tar_y, tar_z, theta, tx_x, tx_y, tx_z, rx_x, rx_y, rx_z]
+    # detections with deployed source and receiver, summed up per target
+    deployed = deployed_s[detection_prob.source] & deployed_r[detection_prob.receiver]
+    cov_sum = np.bincount(detection_prob.target[deployed], weights=detection_prob.values()[deployed], minlength=len(ocean))
+
+    cov_val = {(tar_x, tar_y, tar_z): int(cov_sum[t]) if detection_prob.value is None else cov_sum[t].item() for t, (tar_x, tar_y, tar_z) in enumerate(ocean)}
 
     # ---------------------------------------------------
     # --- output solution as latex
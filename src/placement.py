@@ -0,0 +1,343 @@
+import time
+
+import numpy as np
+
+class Placement:
+
+    """
+    Deployed sources and receivers with incremental coverage counts.
+
+    count[t * len(thetas) + k] is the number of deployed (source, receiver) pairs which detect
+    target t at angle k. A target is covered if it is detected at every angle, which is the
+    coverage of the optimization model. Adding or removing a source or receiver only updates
+    the counts of its own detections, and the gains of all candidates are computed at once
+    from the detection tensor.
+
+    Parameters:
+    - detection_prob (DetectionTensor): detection triples
+    """
+
+    def __init__(self, detection_prob):
+
+        self.targets = len(detection_prob.targets)
+        self.thetas = len(detection_prob.thetas)
+        self.surface = len(detection_prob.surface)
+
+        self.tk = detection_prob.target.astype(np.int64) * self.thetas + detection_prob.theta
+
+        # the source and the receiver of every detection, index 0 and 1 like the deployment
+        self.ends = (detection_prob.source.astype(np.int64), detection_prob.receiver.astype(np.int64))
+
+        # detections of every source and every receiver
+        self.order = []
+        self.start = []
+
+        for end in self.ends:
+            self.order.append(np.argsort(end, kind='stable'))
+            self.start.append(np.concatenate(([0], np.cumsum(np.bincount(end, minlength=self.surface)))))
+
+        self.count = np.zeros(self.targets * self.thetas, dtype=np.int64)
+        self.deployed = (np.zeros(self.surface, dtype=np.bool_), np.zeros(self.surface, dtype=np.bool_))
+
+        # (target, theta) which can be detected at all
+        self.coverable = np.bincount(self.tk, minlength=self.targets * self.thetas) > 0
+
+    def update(self, kind, i, step):
+
+        # detections of source (kind 0) or receiver (kind 1) i paired with the deployed other end
+        detections = self.order[kind][self.start[kind][i]:self.start[kind][i + 1]]
+        detections = detections[self.deployed[1 - kind][self.ends[1 - kind][detections]]]
+
+        np.add.at(self.count, self.tk[detections], step)
+
+    def add(self, kind, i):
+
+        self.deployed[kind][i] = True
+        self.update(kind, i, 1)
+
+    def remove(self, kind, i):
+
+        self.update(kind, i, -1)
+        self.deployed[kind][i] = False
+
+    def covered_targets(self):
+
+        return int((self.count.reshape(self.targets, self.thetas) > 0).all(axis=1).sum())
+
+    def covered_pairs(self):
+
+        return int((self.count > 0).sum())
+
+    def gains(self, kind):
+
+        """
+        Gain of adding each source (kind 0) or receiver (kind 1).
+
+        Returns:
+        - np.ndarray: number of targets which become covered
+        - np.ndarray: number of (target, theta) which become detected
+        """
+
+        other = self.ends[1 - kind]
+        candidate = self.ends[kind]
+
+        # detections of (target, theta) which are not detected yet and whose other end is deployed
+        new = self.deployed[1 - kind][other] & (self.count[self.tk] == 0)
+
+        # every (target, theta, candidate) only once
+        rows = np.unique(self.tk[new] * self.surface + candidate[new])
+        row_candidate = rows % self.surface
+        row_target = rows // self.surface // self.thetas
+
+        pair_gain = np.bincount(row_candidate, minlength=self.surface)
+
+        # a target becomes covered if the candidate detects all its missing angles
+        missing = self.thetas - (self.count.reshape(self.targets, self.thetas) > 0).sum(axis=1)
+
+        keys, counts = np.unique(row_target * self.surface + row_candidate, return_counts=True)
+        complete = counts == missing[keys // self.surface]
+
+        target_gain = np.bincount(keys[complete] % self.surface, minlength=self.surface)
+
+        return target_gain, pair_gain
+
+    def best_pair(self, mask):
+
+        # (source, receiver) pair with the most detections among the detections in mask
+        pairs, counts = np.unique(self.ends[0][mask] * self.surface + self.ends[1][mask], return_counts=True)
+
+        if len(pairs) == 0:
+            return None, 0
+
+        best = int(np.argmax(counts))
+
+        return (int(pairs[best] // self.surface), int(pairs[best] % self.surface)), int(counts[best])
+
+def greedy_coverage(placement, number_of_sources, number_of_receivers):
+
+    # start with the pair which detects the most, then add the source or receiver with the best gain
+    pair, _ = placement.best_pair(np.ones(len(placement.tk), dtype=np.bool_))
+
+    if pair is None or number_of_sources < 1 or number_of_receivers < 1:
+        return
+
+    placement.add(0, pair[0])
+    placement.add(1, pair[1])
+
+    budget = (number_of_sources, number_of_receivers)
+
+    while any(placement.deployed[kind].sum() < budget[kind] for kind in (0, 1)):
+
+        best = None
+
+        for kind in (0, 1):
+
+            if placement.deployed[kind].sum() >= budget[kind]:
+                continue
+
+            target_gain, pair_gain = placement.gains(kind)
+
+            # covered targets first, detected (target, theta) as tie breaker
+            score = np.where(placement.deployed[kind], -1, target_gain * (len(placement.count) + 1) + pair_gain)
+            i = int(np.argmax(score))
+
+            if best is None or score[i] > best[0]:
+                best = (score[i], kind, i)
+
+        placement.add(best[1], best[2])
+
+def local_search_coverage(placement, max_passes=10):
+
+    # move a deployed source or receiver to the best free position as long as the coverage improves
+    for _ in range(max_passes):
+
+        improved = False
+
+        for kind in (0, 1):
+            for i in np.flatnonzero(placement.deployed[kind]).tolist():
+
+                current = (placement.covered_targets(), placement.covered_pairs())
+
+                placement.remove(kind, i)
+
+                target_gain, pair_gain = placement.gains(kind)
+
+                score = np.where(placement.deployed[kind], -1, target_gain * (len(placement.count) + 1) + pair_gain)
+                j = int(np.argmax(score))
+
+                candidate = (placement.covered_targets() + int(target_gain[j]), placement.covered_pairs() + int(pair_gain[j]))
+
+                if j != i and candidate > current:
+                    placement.add(kind, j)
+                    improved = True
+                else:
+                    placement.add(kind, i)
+
+        if not improved:
+            break
+
+def greedy_cost(placement, cost):
+
+    # add the source, receiver or pair with the most new detections per cost until everything is detected
+    while (placement.coverable & (placement.count == 0)).any():
+
+        best = None
+
+        for kind in (0, 1):
+
+            if not placement.deployed[1 - kind].any():
+                continue
+
+            _, pair_gain = placement.gains(kind)
+
+            ratio = np.where(placement.deployed[kind], 0, pair_gain) / cost[kind]
+            i = int(np.argmax(ratio))
+
+            if ratio[i] > 0 and (best is None or ratio[i] > best[0]):
+                best = (ratio[i], [(kind, i)])
+
+        # a new pair, if no single source or receiver helps enough
+        new = (placement.count[placement.tk] == 0) & ~placement.deployed[0][placement.ends[0]] & ~placement.deployed[1][placement.ends[1]]
+
+        pair, count = placement.best_pair(new)
+
+        if pair is not None and (best is None or count / (cost[0] + cost[1]) > best[0]):
+            best = (count / (cost[0] + cost[1]), [(0, pair[0]), (1, pair[1])])
+
+        if best is None:
+            break
+
+        for kind, i in best[1]:
+            placement.add(kind, i)
+
+def drop_redundant(placement, cost):
+
+    # remove sources and receivers which are not needed, the most expensive first
+    dropped = False
+
+    for kind in sorted((0, 1), key=lambda kind: -cost[kind]):
+        for i in np.flatnonzero(placement.deployed[kind]).tolist():
+
+            if placement.deployed[kind].sum() <= 1:
+                break
+
+            placement.remove(kind, i)
+
+            if (placement.coverable & (placement.count == 0)).any():
+                placement.add(kind, i)
+            else:
+                dropped = True
+
+    return dropped
+
+def local_search_cost(placement, cost, max_passes=10):
+
+    # move a deployed source or receiver if another one becomes redundant by the move
+    drop_redundant(placement, cost)
+
+    for _ in range(max_passes):
+
+        improved = False
+
+        for kind in (0, 1):
+            for i in np.flatnonzero(placement.deployed[kind]).tolist():
+
+                if not placement.deployed[kind][i]:
+                    continue
+
+                placement.remove(kind, i)
+
+                # positions which detect everything that is missing without i
+                missing = int((placement.coverable & (placement.count == 0)).sum())
+
+                if missing == 0 and placement.deployed[kind].any():
+                    improved = True
+                    continue
+
+                _, pair_gain = placement.gains(kind)
+
+                candidates = np.flatnonzero((pair_gain == missing) & ~placement.deployed[kind])
+                candidates = candidates[candidates != i]
+
+                moved = False
+
+                for j in candidates[:10].tolist():
+
+                    placement.add(kind, j)
+
+                    if drop_redundant(placement, cost):
+                        moved = True
+                        break
+
+                    placement.remove(kind, j)
+
+                if moved:
+                    improved = True
+                else:
+                    placement.add(kind, i)
+
+        if not improved:
+            break
+
+def greedy_heuristic(instance, ocean, ocean_surface, detection_prob):
+
+    """
+    Placement heuristic without MIP solves, working directly on the detection tensor.
+
+    Sources and receivers are inserted greedily by their marginal gain: for GOAL == 1 by the
+    targets which become covered, until S sources and R receivers are deployed; for GOAL == 0
+    by the (target, theta) which become detected per cost, until everything that can be detected
+    is detected. A local search then moves single sources or receivers (GOAL == 1), or moves
+    them and drops redundant ones (GOAL == 0), with incremental updates of the coverage counts.
+
+    Parameters:
+    - instance (module): instance configuration
+    - ocean (dictonary): 3D dictonary representing ocean
+    - ocean_surface (dictonary): 3D dictonary representing ocean surface
+    - detection_prob (DetectionTensor): detection triples
+
+    Returns:
+    - tuple: (objective value, sources, receivers) with the locations as dictonaries, or None if no solution was found
+    """
+
+    start_time_greedy = time.time()
+
+    placement = Placement(detection_prob)
+
+    if instance.GOAL == 0:
+
+        cost = (instance.S, instance.R)
+
+        greedy_cost(placement, cost)
+
+        if (placement.coverable & (placement.count == 0)).any() or not placement.coverable.all():
+
+            print(f"Greedy heuristic found no solution which covers all pixels")
+            return None
+
+        local_search_cost(placement, cost)
+
+        obj = instance.S * int(placement.deployed[0].sum()) + instance.R * int(placement.deployed[1].sum())
+
+    else:
+
+        greedy_coverage(placement, min(instance.S, placement.surface), min(instance.R, placement.surface))
+        local_search_coverage(placement)
+
+        if placement.deployed[0].sum() != instance.S or placement.deployed[1].sum() != instance.R:
+
+            print(f"Greedy heuristic found no solution with {instance.S} sources and {instance.R} receivers")
+            return None
+
+        obj = 100.0 / len(ocean) * placement.covered_targets()
+
+    surface = list(ocean_surface.keys())
+
+    best_sources = {surface[i]: 1 for i in np.flatnonzero(placement.deployed[0]).tolist()}
+    best_receivers = {surface[i]: 1 for i in np.flatnonzero(placement.deployed[1]).tolist()}
+
+    end_time_greedy = time.time()
+
+    print(f"it took {(end_time_greedy - start_time_greedy):.2f} sec for the greedy heuristic to find a solution with objective value {obj}")
+
+    return obj, best_sources, best_receivers